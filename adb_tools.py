@@ -0,0 +1,1577 @@
+"""ADB 设备操作与性能监控工具集
+
+提供 UI 元素查找/点击、设备信息采集、性能指标监控等能力,
+供自动化测试 Agent 作为工具调用。
+"""
+
+import atexit
+import functools
+import io
+import json
+import os
+import re
+import select
+import shlex
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from types import MappingProxyType
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+try:
+    from numba import njit
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# dumpsys meminfo --proto 的二进制解析需要由 meminfo.proto 生成的
+# protobuf 绑定, 作为可选依赖处理; 缺失时走文本 grep 路径
+try:
+    from meminfo_pb2 import MemInfoDumpProto
+    _HAS_MEMINFO_PROTO = True
+except ImportError:
+    _HAS_MEMINFO_PROTO = False
+
+# 整份快照的美化序列化: orjson 是 C 实现, 比标准库 json 快 5-10 倍,
+# 未安装时退回 json.dumps
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(
+            obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+# 快照落盘/跨进程传输用二进制 msgpack, 比带缩进的 JSON 省数倍
+# CPU 和体积; 未安装时退回紧凑 JSON 的 UTF-8 字节
+try:
+    import msgpack
+
+    def _pack_snapshot(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+except ImportError:
+    def _pack_snapshot(obj):
+        return json.dumps(obj, ensure_ascii=False).encode()
+
+if _HAS_NUMBA:
+    @njit(cache=True)
+    def _fps_stats(arr):
+        """单趟算出帧时间的 sum/jank/min/max, 免去多次 NumPy 掩码分配"""
+        total = 0.0
+        jank = 0
+        mn = 1e18
+        mx = -1.0
+        for i in range(arr.size):
+            v = arr[i]
+            total += v
+            if v > 16.67:
+                jank += 1
+            if v < mn:
+                mn = v
+            if v > mx:
+                mx = v
+        return total / arr.size, jank, mn, mx
+else:
+    def _fps_stats(arr):
+        return (float(arr.mean()), int((arr > 16.67).sum()),
+                float(arr.min()), float(arr.max()))
+
+if _HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _series_slope(arr):
+        """单趟求等间隔序列的最小二乘斜率, 长历史免去中间数组分配"""
+        n = arr.size
+        sy = 0.0
+        sxy = 0.0
+        for i in range(n):
+            v = arr[i]
+            sy += v
+            sxy += i * v
+        sx = n * (n - 1) / 2.0
+        sxx = (n - 1) * n * (2 * n - 1) / 6.0
+        return (n * sxy - sx * sy) / (n * sxx - sx * sx)
+else:
+    def _series_slope(arr):
+        x = np.arange(arr.size, dtype=np.float64)
+        xc = x - x.mean()
+        return float((xc * (arr - arr.mean())).sum() / (xc * xc).sum())
+
+
+# UI 层级 dump 的短时缓存: device_id -> (timestamp, root)
+# 工具节点的线程池里不同设备会并发 dump, 读写都收在锁内;
+# 工具只消费 _ensure_ui_dump 的返回值, 不回头读这个全局
+_ui_dump_cache = {}
+_ui_dump_lock = threading.Lock()
+_UI_DUMP_TTL = 0.5
+
+# USB 抖动时设备可能永久挂起, 所有 adb 调用统一限时, 超时让上层重试
+_ADB_DEFAULT_TIMEOUT = 5.0
+# am start -W 等到应用画完首帧才返回, 冷启动正常就可能超 5s, 单独放宽
+_ADB_STARTUP_TIMEOUT = 30.0
+
+# 编号遍历时跳过的纯布局容器
+_SKIP_CLASSES = ("FrameLayout", "LinearLayout")
+
+# 热路径用到的正则统一在模块级编译一次
+_PHYSICAL_SIZE_RE = re.compile(r"(\d+)x(\d+)")
+_GETPROP_LINE_RE = re.compile(r"^\[([^\]]+)\]: \[([^\]]*)\]", re.MULTILINE)
+_PROC_MEMINFO_RE = re.compile(r"^(MemTotal|MemFree|MemAvailable):\s+(\d+) kB",
+                              re.MULTILINE)
+_PKG_LINE_RE = re.compile(r"(?m)^package:(\S+)")
+_BATCH_SEP_RE = re.compile(r"^__SEP_\d+__\s*$", re.MULTILINE)
+_RE_MEMINFO = re.compile(r"^\s*(Java Heap|Native Heap|Graphics|TOTAL PSS):\s*(\d+)",
+                         re.MULTILINE)
+_RE_BATTERY = re.compile(r"^\s*(level|status|temperature):\s*(\d+)", re.MULTILINE)
+_RE_STARTUP = re.compile(r"^\s*(TotalTime|WaitTime):\s*(\d+)", re.MULTILINE)
+_RE_TCP_LINE = re.compile(r"(?im)^\s*tcp")
+# finditer 结果的字段名 -> 指标键 分发表, 模块加载时构建一次
+_MEMINFO_KEYS = {"Java Heap": "java_heap_mb", "Native Heap": "native_heap_mb",
+                 "Graphics": "graphics_mb", "TOTAL PSS": "total_pss_mb"}
+_STARTUP_KEYS = {"TotalTime": "total_time_ms", "WaitTime": "wait_time_ms"}
+# 监控摘要的空结果: 键集与正常路径一致且只读, 下游不用再判键存在与否
+_EMPTY_SUMMARY = MappingProxyType({
+    "total_snapshots": 0,
+    "successful_snapshots": 0,
+    "total_anomalies": 0,
+    "average_memory_mb": 0.0,
+    "average_cpu_percent": 0.0,
+    "average_fps": 0.0,
+})
+_RE_UDP_LINE = re.compile(r"(?im)^\s*udp")
+_RE_NUMBER = re.compile(r"\d+(\.\d+)?")
+_RE_FRAME_LINE = re.compile(r"(?m)^[^\n]*FrameTime[^\n]*$")
+_RE_NUM_TOKEN = re.compile(r"\d+\.?\d*")
+_ACTIVITY_PATTERNS = (
+    re.compile(r"mResumedActivity.*?([\w.]+/[\w.]+)"),
+    re.compile(r"mFocusedActivity.*?([\w.]+/[\w.]+)"),
+    re.compile(r"mCurrentFocus.*?([\w.]+/[\w.]+)"),
+    re.compile(r"ACTIVITY ([\w.]+/[\w.]+)"),
+)
+
+class _AdbShell:
+    """长连接 adb shell 会话
+
+    每次 adb 客户端冷启动 + 连接 adbd 要 100-300ms; 把命令写入同一个
+    长驻 shell 的 stdin 并用哨兵行分帧, 多步操作摊销连接成本。
+    """
+
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, device_id=None):
+        self.device_id = device_id
+        self.proc = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get(cls, device_id=None):
+        with cls._sessions_lock:
+            session = cls._sessions.get(device_id)
+            if session is None:
+                session = cls(device_id)
+                cls._sessions[device_id] = session
+            return session
+
+    def _spawn(self):
+        argv = ["adb"]
+        if self.device_id:
+            argv += ["-s", self.device_id]
+        argv.append("shell")
+        self.proc = subprocess.Popen(argv, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, bufsize=0)
+
+    def run(self, cmd, timeout=_ADB_DEFAULT_TIMEOUT):
+        """在会话内执行命令, 返回 (returncode, stdout 文本)
+
+        只在会话本身不可用(起不来/管道断开)时回退为一次性 adb
+        调用; 读超时抛 RuntimeError 而不重放命令 —— 慢设备上命令
+        可能已在执行, 重放会让 input 这类非幂等命令跑两次。
+        """
+        with self.lock:
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    self._spawn()
+                # 先存 rc 再补一个空行, 保证哨兵永远独占一行:
+                # 命令输出末尾缺换行时哨兵不会粘进最后一行数据
+                self.proc.stdin.write(
+                    f"{cmd}; __rc=$?; echo; echo __END__${{__rc}}__\n".encode())
+                self.proc.stdin.flush()
+            except (OSError, ValueError):
+                self.proc = None
+                return self._run_once(cmd)
+            fd = self.proc.stdout.fileno()
+            deadline = time.monotonic() + timeout
+            buf = b""
+            lines = []
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.proc.kill()
+                    self.proc = None
+                    raise RuntimeError("adb shell 会话超时")
+                ready, _, _ = select.select([fd], [], [], remaining)
+                if not ready:
+                    continue
+                try:
+                    chunk = os.read(fd, 65536)
+                except OSError:
+                    chunk = b""
+                if not chunk:
+                    # 对端关闭管道, 命令没送达对端执行, 一次性重放
+                    self.proc = None
+                    return self._run_once(cmd)
+                buf += chunk
+                while b"\n" in buf:
+                    raw, buf = buf.split(b"\n", 1)
+                    line = raw.decode("utf-8", "replace")
+                    if line.startswith("__END__"):
+                        rc_text = line[len("__END__"):].split("__", 1)[0]
+                        # 丢掉哨兵前自己补的那个空行
+                        if lines and lines[-1] == "\n":
+                            lines.pop()
+                        return int(rc_text or 0), "".join(lines)
+                    lines.append(line + "\n")
+
+    def _run_once(self, cmd):
+        """会话不可用时的一次性 adb 回退, 超时同样以 RuntimeError 上抛"""
+        try:
+            result = subprocess.run(_adb_argv(self.device_id, "shell", cmd),
+                                    capture_output=True, text=True,
+                                    timeout=_ADB_DEFAULT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("ADB 超时")
+        return result.returncode, result.stdout
+
+    @classmethod
+    def close_all(cls):
+        """关闭全部会话, 进程退出时由 atexit 调用"""
+        with cls._sessions_lock:
+            for session in cls._sessions.values():
+                proc = session.proc
+                if proc is not None and proc.poll() is None:
+                    try:
+                        proc.terminate()
+                    except Exception:
+                        pass
+            cls._sessions.clear()
+
+
+atexit.register(_AdbShell.close_all)
+
+
+def _adb_argv(device_id, *args):
+    """构造 adb 命令 argv, 统一免掉宿主机 /bin/sh -c 一跳"""
+    return ["adb", *(["-s", device_id] if device_id else []), *args]
+
+
+def _adb_shell_run(cmd, device_id=None):
+    """通过持久会话执行设备侧命令, 返回 stdout"""
+    return _AdbShell.get(device_id).run(cmd)[1]
+
+
+# 短 TTL 的原始输出缓存: 一个快照窗口内的重复探针直接复用 stdout
+_RAW_CACHE = {}
+_RAW_CACHE_LOCK = threading.Lock()
+
+
+def _adb_shell_cached(device_id, cmd, ttl=2.0):
+    """带 TTL 的 _adb_shell_run, 键为 (device_id, cmd)"""
+    key = (device_id, cmd)
+    now = time.monotonic()
+    with _RAW_CACHE_LOCK:
+        cached = _RAW_CACHE.get(key)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+    output = _adb_shell_run(cmd, device_id)
+    with _RAW_CACHE_LOCK:
+        _RAW_CACHE[key] = (now, output)
+    return output
+
+
+def _invalidate_raw_cache():
+    """清空原始输出缓存, 监控循环每轮开头调用防跨轮陈旧"""
+    with _RAW_CACHE_LOCK:
+        _RAW_CACHE.clear()
+
+
+def _ttl_cache(maxsize=64, ttl=0.5):
+    """以调用参数为键缓存结果的 TTL 装饰器
+
+    _adb_shell_cached 缓存的是原始输出, 这里缓存的是解析后的结果,
+    高频重复调用连解析都省掉。wrapper.invalidate() 清空缓存,
+    wrapper.ttl 可按采样 interval 调整。
+    """
+    def decorator(fn):
+        cache = {}
+        lock = threading.Lock()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with lock:
+                hit = cache.get(key)
+                if hit is not None and now < hit[1]:
+                    return hit[0]
+            value = fn(*args, **kwargs)
+            with lock:
+                if len(cache) >= maxsize:
+                    cache.clear()
+                cache[key] = (value, now + wrapper.ttl)
+            return value
+
+        def invalidate():
+            with lock:
+                cache.clear()
+
+        wrapper.invalidate = invalidate
+        wrapper.ttl = ttl
+        return wrapper
+    return decorator
+
+
+# 秒级时间戳缓存: 高频采样时同一秒内几十次 strftime 只算一次
+_last_ts_sec = -1
+_last_ts_str = ""
+
+
+def _now_str():
+    """返回 '%Y-%m-%d %H:%M:%S' 格式的当前时间, 按整秒记忆化"""
+    global _last_ts_sec, _last_ts_str
+    sec = int(time.time())
+    if sec != _last_ts_sec:
+        _last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        _last_ts_sec = sec
+    return _last_ts_str
+
+
+def _format_ts(ts):
+    """epoch 浮点时间戳转可读字符串, 只在输出边界调用"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+# 设备能力探测结果, 每设备嗅探一次后复用
+_device_caps = {}
+_device_caps_lock = threading.Lock()
+
+
+def _probe_cap(device_id, cmd):
+    """跑一条小命令判断设备是否支持该用法"""
+    try:
+        rc, output = _AdbShell.get(device_id).run(cmd)
+        low = output.lower()
+        return rc == 0 and "bad" not in low and "invalid" not in low
+    except Exception:
+        return False
+
+
+def _caps(device_id=None):
+    """老版 Android 的 top/logcat 不支持部分参数, 按设备嗅探并缓存
+
+    monitor_performance 每轮都在选命令串, 不缓存的话能力嗅探
+    本身就会变成一类探针开销; 失败还会被当成整轮采集失败吞掉。
+    """
+    caps = _device_caps.get(device_id)
+    if caps is None:
+        caps = {
+            "top_o": _probe_cap(device_id, "top -n 1 -b -o %CPU | head -n 2"),
+            "logcat_regex": _probe_cap(
+                device_id, "logcat --help 2>&1 | grep -q -- --regex"),
+            # 不丢弃输出: 老设备对 --proto 回的是错误文本, 管道 rc
+            # 是 head 的恒 0, 只有让 _probe_cap 看到文本才能判出来
+            "meminfo_proto": _probe_cap(
+                device_id, "dumpsys meminfo --proto | head -c 16"),
+        }
+        with _device_caps_lock:
+            _device_caps[device_id] = caps
+    return caps
+
+
+def _top_command(device_id=None):
+    """按设备能力选 top 命令串, 老设备不认 -b/-o"""
+    return ("top -n 1 -b -o PID,%CPU,CMDLINE" if _caps(device_id)["top_o"]
+            else "top -n 1")
+
+
+def _stream_adb_shell(device_id, cmd, timeout=_ADB_DEFAULT_TIMEOUT):
+    """Popen 流式逐行产出 stdout, 整份输出不落入内存
+
+    提前 close() 生成器会 terminate 子进程, 答案在输出前部时
+    连 USB 传输都能省掉一截; 单次读等待超过 timeout 视为设备
+    挂死, 终止子进程并抛错。
+    """
+    proc = subprocess.Popen(_adb_argv(device_id, "shell", cmd),
+                            stdout=subprocess.PIPE)
+    try:
+        fd = proc.stdout.fileno()
+        buf = b""
+        while True:
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if not ready:
+                raise RuntimeError("ADB 超时")
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buf += chunk
+            while b"\n" in buf:
+                raw, buf = buf.split(b"\n", 1)
+                yield raw.decode("utf-8", "replace") + "\n"
+        if buf:
+            yield buf.decode("utf-8", "replace")
+    finally:
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+
+
+def _run_adb_shell_batch(device_id, commands):
+    """一次 adb shell 执行多条命令, 按哨兵行切回各自的输出
+
+    N 条命令各付一次连接成本变为整批付一次, 综合报告类
+    多探针调用的延迟由往返次数主导, 收益接近 N 倍。
+    """
+    combined = " ; ".join(f"{cmd} ; echo __SEP_{i}__"
+                          for i, cmd in enumerate(commands))
+    # 整批写入长驻会话, 连 adb 客户端的 fork+连接开销也省掉;
+    # 会话不可用时由 _AdbShell.run 自动回退一次性调用
+    output = _AdbShell.get(device_id).run(combined)[1]
+    blocks = _BATCH_SEP_RE.split(output)
+    return [block.strip("\n") for block in blocks[:len(commands)]]
+
+
+# bounds 串形如 '[L,T][R,B]', 定长平凡格式用 translate+split 比正则快一个量级
+_BOUNDS_TRANS = str.maketrans("[],", "   ")
+
+
+def _parse_bounds(bounds):
+    """解析 bounds 串为 (x1, y1, x2, y2), 非法输入返回 None"""
+    if not bounds:
+        return None
+    try:
+        x1, y1, x2, y2 = bounds.translate(_BOUNDS_TRANS).split()
+    except ValueError:
+        return None
+    return int(x1), int(y1), int(x2), int(y2)
+
+
+def _parse_battery(text):
+    """解析 dumpsys battery 文本, 返回 {level/status/temperature: int}"""
+    return {m.group(1): int(m.group(2)) for m in _RE_BATTERY.finditer(text)}
+
+
+def _ensure_ui_dump(device_id=None, ttl=_UI_DUMP_TTL, force_refresh=False):
+    """获取当前界面的 XML 树, TTL 内复用上一次 dump
+
+    uiautomator dump + pull 是 UI 操作的主要延迟(秒级),
+    Agent 的连续多步操作通过这里共享同一份解析结果。
+    """
+    now = time.monotonic()
+    if not force_refresh:
+        with _ui_dump_lock:
+            cached = _ui_dump_cache.get(device_id)
+        if cached is not None and now - cached[0] < ttl:
+            return cached[1]
+
+    # exec-out 直接把 XML 流到 stdout, 免去 pull 与落盘再读取
+    try:
+        xml_bytes = subprocess.check_output(
+            _adb_argv(device_id, "exec-out", "uiautomator", "dump", "/dev/tty"),
+            timeout=_ADB_DEFAULT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError("ADB 超时")
+    marker = xml_bytes.rfind(b"UI hierchary dumped to")
+    if marker != -1:
+        xml_bytes = xml_bytes[:marker]
+    root = ET.fromstring(xml_bytes)
+
+    with _ui_dump_lock:
+        _ui_dump_cache[device_id] = (now, root)
+    return root
+
+
+def _numbered_elements(root):
+    """前序遍历产出 (编号, 元素), 跳过纯布局容器
+
+    编号是整个点击系工具的共同契约: get_ui_elements 列出的 [n]
+    必须与 tap_element(n)/get_element_info(n) 解析到同一个节点,
+    所以遍历顺序和跳过规则只能定义在这一处。
+    """
+    number = 0
+    for elem in root.iter():
+        if elem.get("class", "").endswith(_SKIP_CLASSES):
+            continue
+        yield number, elem
+        number += 1
+
+
+class AdbUITools:
+    """基于 uiautomator dump 的 UI 查找与操作工具"""
+
+    # 屏幕尺寸会话内不变, 首次 wm size 后按 device_id 缓存
+    _screen_size = {}
+
+    def _get_screen_size(self, device_id=None):
+        """返回 (width, height), 查询结果缓存后不再重复 round-trip"""
+        size = self._screen_size.get(device_id)
+        if size is None:
+            output = _adb_shell_run("wm size", device_id)
+            match = _PHYSICAL_SIZE_RE.search(output)
+            if not match:
+                return None
+            size = (int(match.group(1)), int(match.group(2)))
+            self._screen_size[device_id] = size
+        return size
+
+    def get_ui_elements(self, device_id=None):
+        """列出当前界面所有可见元素"""
+        try:
+            root = _ensure_ui_dump(device_id)
+
+            count = 0
+            lines = []
+            for number, elem in _numbered_elements(root):
+                count += 1
+                text = elem.get("text", "")
+                desc = elem.get("content-desc", "")
+                if text or desc:
+                    lines.append(f"[{number}] {elem.get('class', '')} "
+                                 f"text={text} desc={desc} bounds={elem.get('bounds', '')}")
+
+            lines.insert(0, f"当前界面共 {count} 个元素:")
+            return "\n".join(lines) + "\n"
+        except Exception as e:
+            return f"获取界面元素失败: {e}"
+
+    def annotate_screenshot(self, image_path, output_path=None, device_id=None):
+        """在截图上框出当前界面的全部可交互元素
+
+        所有矩形复用同一个 ImageDraw 上下文一次画完, 避免每个元素
+        重建 draw 对象; 几十个控件的标注开销从线性对象构造降为常数。
+        """
+        try:
+            root = _ensure_ui_dump(device_id)
+            boxes = []
+            for _, elem in _numbered_elements(root):
+                parsed = _parse_bounds(elem.get("bounds", ""))
+                if parsed:
+                    boxes.append(parsed)
+
+            img = Image.open(image_path).convert("RGB")
+            draw = ImageDraw.Draw(img)
+            for x1, y1, x2, y2 in boxes:
+                draw.rectangle((x1, y1, x2, y2), outline=(255, 0, 0), width=2)
+            img.save(output_path or image_path)
+            return f"已标注 {len(boxes)} 个元素"
+        except Exception as e:
+            return f"标注截图失败: {e}"
+
+    def tap_element(self, element_num, device_id=None):
+        """按编号点击界面元素"""
+        try:
+            root = _ensure_ui_dump(device_id)
+
+            # 命中即停, 不物化全量列表
+            target = next((elem for number, elem in _numbered_elements(root)
+                           if number == element_num), None)
+            if target is None:
+                return f"未找到编号为 {element_num} 的元素"
+
+            parsed = _parse_bounds(target.get("bounds", ""))
+            if parsed is None:
+                return f"元素 {element_num} 没有有效坐标"
+
+            x1, y1, x2, y2 = parsed
+            x, y = (x1 + x2) // 2, (y1 + y2) // 2
+
+            _adb_shell_run(f"input tap {x} {y}", device_id)
+            return f"已点击元素 {element_num}, 坐标 ({x}, {y})"
+        except Exception as e:
+            return f"点击元素失败: {e}"
+
+    def tap_elements(self, element_nums, device_id=None):
+        """按编号批量点击多个元素
+
+        只 dump 一次界面, 单趟遍历解析出全部目标坐标, 再把所有
+        input tap 合成一条命令在设备侧顺序执行, 整个批次一次往返。
+        """
+        try:
+            root = _ensure_ui_dump(device_id)
+            wanted = set(element_nums)
+            coords = {}
+            for number, elem in _numbered_elements(root):
+                if number in wanted:
+                    parsed = _parse_bounds(elem.get("bounds", ""))
+                    if parsed:
+                        x1, y1, x2, y2 = parsed
+                        coords[number] = ((x1 + x2) // 2, (y1 + y2) // 2)
+                    if len(coords) == len(wanted):
+                        break
+
+            missing = [n for n in element_nums if n not in coords]
+            if missing:
+                return f"未找到编号为 {missing} 的元素"
+
+            cmd = "; ".join(f"input tap {coords[n][0]} {coords[n][1]}"
+                            for n in element_nums)
+            _adb_shell_run(cmd, device_id)
+            return "已依次点击元素 " + ", ".join(
+                f"{n}({coords[n][0]},{coords[n][1]})" for n in element_nums)
+        except Exception as e:
+            return f"批量点击失败: {e}"
+
+    def find_element_by_text(self, text, device_id=None):
+        """按文本查找元素"""
+        try:
+            root = _ensure_ui_dump(device_id)
+
+            lines = [f"查找文本 '{text}' 的结果:"]
+            for elem in root.iter():
+                elem_text = elem.get("text", "")
+                content_desc = elem.get("content-desc", "")
+                if text in elem_text or text in content_desc:
+                    parsed = _parse_bounds(elem.get("bounds", ""))
+                    if parsed:
+                        x1, y1, x2, y2 = parsed
+                        cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+                        lines.append(f"- {elem.get('class','')} text={elem_text} 中心=({cx},{cy})")
+                    else:
+                        lines.append(f"- {elem.get('class','')} text={elem_text}")
+
+            if len(lines) == 1:
+                lines.append("未找到匹配元素")
+
+            return "\n".join(lines) + "\n"
+        except Exception as e:
+            return f"查找元素失败: {e}"
+
+    def find_element_by_class(self, class_name, device_id=None):
+        """按类名查找元素"""
+        try:
+            root = _ensure_ui_dump(device_id)
+
+            # 只需要第一个匹配, 命中即停止遍历
+            elem = next((e for e in root.iter()
+                         if class_name in e.get("class", "")), None)
+            if elem is None:
+                return f"未找到类名包含 '{class_name}' 的元素"
+
+            result = (f"找到元素: class={elem.get('class','')} "
+                      f"text={elem.get('text','')} bounds={elem.get('bounds','')}")
+
+            return result
+        except Exception as e:
+            return f"查找元素失败: {e}"
+
+    def get_element_info(self, element_num, device_id=None):
+        """获取指定编号元素的详细属性"""
+        try:
+            root = _ensure_ui_dump(device_id)
+
+            for number, elem in _numbered_elements(root):
+                if number == element_num:
+                    lines = [f"元素 {element_num} 详细信息:",
+                             f"class: {elem.get('class','')}",
+                             f"text: {elem.get('text','')}",
+                             f"resource-id: {elem.get('resource-id','')}",
+                             f"content-desc: {elem.get('content-desc','')}",
+                             f"clickable: {elem.get('clickable','')}"]
+                    bounds = elem.get("bounds", "")
+                    parsed = _parse_bounds(bounds)
+                    if parsed:
+                        x1, y1, x2, y2 = parsed
+                        lines.append(f"bounds: {bounds} 中心=({(x1+x2)//2},{(y1+y2)//2})")
+                    return "\n".join(lines) + "\n"
+
+            return f"未找到编号为 {element_num} 的元素"
+        except Exception as e:
+            return f"获取元素信息失败: {e}"
+
+    def press_back(self, device_id=None):
+        """按返回键"""
+        _adb_shell_run("input keyevent 4", device_id)
+        return "已按返回键"
+
+    def press_home(self, device_id=None):
+        """按 Home 键"""
+        _adb_shell_run("input keyevent 3", device_id)
+        return "已按 Home 键"
+
+    def input_text(self, text, device_id=None):
+        """向当前焦点输入文本"""
+        _adb_shell_run(f"input text {shlex.quote(text)}", device_id)
+        return f"已输入文本: {text}"
+
+    def swipe_screen(self, direction="up", device_id=None):
+        """按方向滑动屏幕"""
+        try:
+            size = self._get_screen_size(device_id)
+            if size is None:
+                return "无法获取屏幕尺寸"
+            width, height = size
+
+            cx, cy = width // 2, height // 2
+            if direction == "up":
+                args = (cx, int(height * 0.7), cx, int(height * 0.3))
+            elif direction == "down":
+                args = (cx, int(height * 0.3), cx, int(height * 0.7))
+            elif direction == "left":
+                args = (int(width * 0.7), cy, int(width * 0.3), cy)
+            else:
+                args = (int(width * 0.3), cy, int(width * 0.7), cy)
+
+            _adb_shell_run(
+                f"input swipe {args[0]} {args[1]} {args[2]} {args[3]} 300", device_id)
+            return f"已向{direction}滑动"
+        except Exception as e:
+            return f"滑动失败: {e}"
+
+    def list_installed_apps(self, device_id=None):
+        """列出已安装的第三方应用"""
+        try:
+            output = _adb_shell_run("pm list packages -3", device_id)
+            # findall 在 C 层单趟扫完全部行, 免掉 Python 级循环
+            pkgs = _PKG_LINE_RE.findall(output)
+            return "已安装的第三方应用:\n\n" + "\n".join(f"- {p}" for p in pkgs) + "\n"
+        except Exception as e:
+            return f"获取应用列表失败: {e}"
+
+    def get_app_package(self, device_id=None):
+        """查找目标应用包名"""
+        try:
+            output = _adb_shell_run("pm list packages", device_id)
+            pkg = next((p for p in _PKG_LINE_RE.findall(output) if "bluex" in p),
+                       None)
+            if pkg:
+                return pkg
+            return ""
+        except Exception:
+            return ""
+
+
+class DeviceInfoCollector:
+    """设备基础信息采集"""
+
+    _ACTIVITY_CACHE_TTL = 1.0
+
+    def __init__(self):
+        # ro.* 属性每次开机后不变, 按 device_id 记忆化
+        self._prop_cache = {}
+        # 前台 Activity 短 TTL 缓存, 连续探测不重复 dumpsys
+        self._activity_cache = {}
+
+    def execute_adb_command(self, command, device_id=None):
+        """执行 adb 命令并返回输出
+
+        command 可为 argv 列表或命令串; 统一转 argv 直接 exec,
+        省掉 /bin/sh -c 的 fork 并消除注入面。
+        """
+        command_list = command if isinstance(command, list) else shlex.split(command)
+        argv = ["adb", *(["-s", device_id] if device_id else []), *command_list]
+        try:
+            return subprocess.check_output(argv, text=True,
+                                           timeout=_ADB_DEFAULT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("ADB 超时")
+
+    def _getprops(self, device_id=None):
+        """一次 round-trip 拉取全部系统属性, 返回 {key: value}
+
+        不带参数的 getprop 会 dump 所有属性; 单次调用比逐 key 查询
+        少付 N-1 次 USB/TCP 往返。
+        """
+        props = self._prop_cache.get(device_id)
+        if props is None:
+            output = self.execute_adb_command("shell getprop", device_id)
+            props = dict(_GETPROP_LINE_RE.findall(output))
+            self._prop_cache[device_id] = props
+        return props
+
+    def get_android_version(self, device_id=None):
+        """获取 Android 版本号"""
+        return self._getprops(device_id).get("ro.build.version.release", "").strip()
+
+    def get_device_model(self, device_id=None):
+        """获取设备型号"""
+        return self._getprops(device_id).get("ro.product.model", "").strip()
+
+    def collect_info(self, device_id=None):
+        """汇总设备信息与前台应用
+
+        三项查询互相独立且都在等 adbd 的 IO, 并发发出近似线性加速。
+        """
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            fv = ex.submit(self.get_android_version, device_id)
+            fm = ex.submit(self.get_device_model, device_id)
+            fa = ex.submit(self._detect_app_activity, device_id)
+            android_version = fv.result().strip()
+            device_name = fm.result().strip()
+            current_activity = fa.result()
+        return {
+            "device_id": device_id,
+            "android_version": android_version,
+            "device_name": device_name,
+            "current_activity": current_activity,
+        }
+
+    def get_device_info(self, device_id=None):
+        """设备信息的格式化输出"""
+        info = self.collect_info(device_id)
+        return (f"设备: {info['device_name']}\n"
+                f"Android 版本: {info['android_version']}\n"
+                f"前台 Activity: {info['current_activity']}")
+
+    def _detect_app_activity(self, device_id=None):
+        """探测前台 Activity"""
+        cached = self._activity_cache.get(device_id)
+        if cached is not None and time.time() - cached[0] < self._ACTIVITY_CACHE_TTL:
+            return cached[1]
+        activity = self._detect_app_activity_uncached(device_id)
+        self._activity_cache[device_id] = (time.time(), activity)
+        return activity
+
+    def _detect_app_activity_uncached(self, device_id=None):
+        # 快速路径: grep 放在设备侧执行, 只回传 mResumedActivity/
+        # mFocusedActivity 那几行(几百字节), 而不是整个 dumpsys。
+        try:
+            rc, output = _AdbShell.get(device_id).run(
+                "dumpsys activity activities | "
+                "grep -E 'mResumedActivity|mFocusedActivity' | head -n 2")
+            if rc == 0 and output:
+                # 回传只有一两行, 直接按固定 token 结构切串即可,
+                # 正则只留作格式漂移时的兜底
+                for line in output.splitlines():
+                    if "ActivityRecord{" in line:
+                        tokens = line.split("ActivityRecord{", 1)[1].split()
+                        if len(tokens) >= 3 and "/" in tokens[2]:
+                            return tokens[2].rstrip("}")
+                for pattern in _ACTIVITY_PATTERNS:
+                    match = pattern.search(output)
+                    if match:
+                        return match.group(1)
+        except Exception:
+            pass
+        commands = [
+            "shell dumpsys activity activities",
+            "shell dumpsys window windows",
+            "shell dumpsys activity top",
+            "shell dumpsys window",
+        ]
+        for command in commands:
+            try:
+                output = self.execute_adb_command(command, device_id)
+                for pattern in _ACTIVITY_PATTERNS:
+                    match = pattern.search(output)
+                    if match:
+                        return match.group(1)
+            except Exception:
+                continue
+        return "未知"
+
+    def take_screenshot(self, output_path="screenshot.png", device_id=None):
+        """截取设备屏幕
+
+        exec-out 把 PNG 直接流到 stdout, 单次往返, 不经 /sdcard 落盘,
+        省掉原来 screencap/pull/rm 三次 adb 调用。
+        """
+        try:
+            argv = ["adb", *(["-s", device_id] if device_id else []),
+                    "exec-out", "screencap", "-p"]
+            with open(output_path, "wb") as f:
+                subprocess.run(argv, stdout=f, check=True,
+                               timeout=_ADB_DEFAULT_TIMEOUT)
+            return f"截图已保存到 {output_path}"
+        except subprocess.TimeoutExpired:
+            return "截图失败: ADB 超时"
+        except Exception as e:
+            return f"截图失败: {e}"
+
+
+class PerformanceMonitor:
+    """设备级性能指标监控(格式化文本输出)"""
+
+    # 各 get_* 拆为 取数 + 纯解析 两层: 解析器只吃原始文本,
+    # 综合报告可以把一次批量 shell 的分段输出直接喂给解析器。
+
+    @staticmethod
+    def _parse_cpu_usage(raw):
+        # 只展示前 15 行, islice 惰性取行, 不物化整份 cpuinfo
+        report = "CPU 使用情况:\n"
+        for line in islice(io.StringIO(raw.strip()), 15):
+            report += line.rstrip("\n") + "\n"
+        return report
+
+    def get_cpu_usage(self, device_id=None):
+        """获取整机 CPU 占用"""
+        try:
+            result = _adb_shell_run("dumpsys cpuinfo", device_id)
+            return self._parse_cpu_usage(result)
+        except Exception as e:
+            return f"获取 CPU 信息失败: {e}"
+
+    def get_memory_usage(self, device_id=None):
+        """获取整机内存占用
+
+        完整 dumpsys meminfo 要遍历所有进程的 PSS(忙设备上要数秒),
+        只看整机水位时读 /proc/meminfo 是微秒级且传输量极小。
+        """
+        try:
+            return self._format_memory(self._collect_memory(device_id))
+        except Exception as e:
+            return f"获取内存信息失败: {e}"
+
+    @staticmethod
+    def _memory_from_raw(raw):
+        """解析 /proc/meminfo 文本为 {字段: MB} 数值字典"""
+        return {key: int(kb) // 1024
+                for key, kb in _PROC_MEMINFO_RE.findall(raw)}
+
+    @staticmethod
+    def _format_memory(data):
+        report = "内存使用情况:\n"
+        for key, label in (("MemTotal", "总内存"), ("MemFree", "空闲内存"),
+                           ("MemAvailable", "可用内存")):
+            if key in data:
+                report += f"{label}: {data[key]} MB\n"
+        return report
+
+    def _collect_memory(self, device_id=None):
+        return self._memory_from_raw(_adb_shell_run("cat /proc/meminfo", device_id))
+
+    def get_battery_status(self, device_id=None):
+        """获取电池状态"""
+        try:
+            return self._format_battery(self._collect_battery(device_id))
+        except Exception as e:
+            return f"获取电池信息失败: {e}"
+
+    @staticmethod
+    def _battery_from_raw(raw):
+        """解析 dumpsys battery 文本为数值字典"""
+        return _parse_battery(raw)
+
+    @staticmethod
+    def _format_battery(data):
+        level = data.get("level", "未知")
+        status = data.get("status", "未知")
+        temperature = data.get("temperature", "未知")
+        return (f"电池电量: {level}%\n"
+                f"电池状态: {status}\n"
+                f"电池温度: {temperature / 10 if temperature != '未知' else temperature}°C")
+
+    def _collect_battery(self, device_id=None):
+        return self._battery_from_raw(_adb_shell_cached(device_id, "dumpsys battery"))
+
+    def get_network_status(self, device_id=None):
+        """获取网络连接统计"""
+        try:
+            return self._format_network(self._collect_network(device_id))
+        except Exception as e:
+            return f"获取网络信息失败: {e}"
+
+    @staticmethod
+    def _network_from_raw(raw):
+        # findall 在 C 层数行, 不再物化整份 netstat 的行列表
+        return {"tcp": len(_RE_TCP_LINE.findall(raw)),
+                "udp": len(_RE_UDP_LINE.findall(raw))}
+
+    @staticmethod
+    def _format_network(data):
+        return (f"网络连接状态:\n"
+                f"TCP 连接数: {data['tcp']}\n"
+                f"UDP 连接数: {data['udp']}")
+
+    def _collect_network(self, device_id=None):
+        return self._network_from_raw(_adb_shell_run("netstat", device_id))
+
+    def get_storage_info(self, device_id=None):
+        """获取存储占用"""
+        try:
+            result = _adb_shell_cached(device_id, "df /data")
+            return "存储使用情况:\n" + result
+        except Exception as e:
+            return f"获取存储信息失败: {e}"
+
+    def get_running_processes(self, device_id=None):
+        """获取进程数量与 CPU 占用前五的进程"""
+        try:
+            # 行数在设备侧 wc -l 算好, 跨 adb 只回传一个整数;
+            # top 同样在设备侧截到前 6 行
+            blocks = _run_adb_shell_batch(
+                device_id,
+                ["ps -A | wc -l", f"{_top_command(device_id)} | head -n 6"])
+            return self._parse_running_processes(blocks[0], blocks[1])
+        except Exception as e:
+            return f"获取进程信息失败: {e}"
+
+    @staticmethod
+    def _parse_running_processes(count_raw, top_raw):
+        # count_raw 是设备侧 wc -l 的输出, 减去表头行
+        process_count = int(count_raw.strip()) - 1
+        return PerformanceMonitor._parse_running_processes_counted(
+            process_count, top_raw)
+
+    @staticmethod
+    def _parse_running_processes_counted(process_count, top_raw):
+        report = f"运行中的进程数: {process_count}\n\nCPU 占用前五:\n"
+        for line in islice(io.StringIO(top_raw.strip()), 1, 6):
+            report += line.rstrip("\n") + "\n"
+        return report
+
+    def get_logcat(self, keyword=None, device_id=None, level=None,
+                   package_name=None):
+        """获取设备日志, 过滤全部放在设备侧执行
+
+        全量 logcat 可达数 MB; --regex/--pid 让设备只回传命中行,
+        跨 adb 传输的字节数下降几个量级。
+        """
+        try:
+            cmd = "logcat -d -v brief"
+            if package_name:
+                cmd += f" --pid=$(pidof -s {shlex.quote(package_name)})"
+            if keyword:
+                if _caps(device_id)["logcat_regex"]:
+                    cmd += f" --regex {shlex.quote(keyword)}"
+                else:
+                    cmd += f" | grep {shlex.quote(keyword)}"
+            # 流式消费 + 定长 deque: 只保留末 100 行, 峰值内存与日志量无关
+            lines = deque(maxlen=100)
+            prefix = (level[0] + "/") if level else None
+            for line in _stream_adb_shell(device_id, cmd):
+                # brief 格式行首即级别 (如 'E/Tag(123): ...')
+                if prefix is None or line.startswith(prefix):
+                    lines.append(line.rstrip("\n"))
+            return "\n".join(lines)
+        except Exception as e:
+            return f"获取日志失败: {e}"
+
+    def get_comprehensive_performance(self, device_id=None):
+        """汇总 CPU/内存/电池/网络/存储/进程 的综合报告
+
+        七个探针合并为一次批量 shell, 只付一次 adb 往返。
+        """
+        commands = ["dumpsys cpuinfo", "cat /proc/meminfo", "dumpsys battery",
+                    "netstat", "df /data", "ps -A | wc -l",
+                    f"{_top_command(device_id)} | head -n 6"]
+        try:
+            blocks = _run_adb_shell_batch(device_id, commands)
+            # 单个连续缓冲逐段 write, 避免中间小字符串对象堆积
+            buf = io.StringIO()
+            buf.write("=== 设备性能综合报告 ===\n\n")
+            buf.write(self._parse_cpu_usage(blocks[0]))
+            buf.write("\n\n")
+            buf.write(self._format_memory(self._memory_from_raw(blocks[1])))
+            buf.write("\n\n")
+            buf.write(self._format_battery(self._battery_from_raw(blocks[2])))
+            buf.write("\n\n")
+            buf.write(self._format_network(self._network_from_raw(blocks[3])))
+            buf.write("\n\n存储使用情况:\n")
+            buf.write(blocks[4])
+            buf.write("\n\n")
+            buf.write(self._parse_running_processes(blocks[5], blocks[6]))
+            return buf.getvalue()
+        except Exception as e:
+            return f"获取综合性能失败: {e}"
+
+    def monitor_performance_continuous(self, duration=60, interval=5, device_id=None):
+        """按固定间隔持续采样内存信息"""
+        buf = io.StringIO()
+        iterations = max(1, duration // interval)
+        # 固定 deadline 递增, 探针耗时不会把采样点越推越晚
+        next_deadline = time.monotonic()
+        for i in range(iterations):
+            timestamp = _now_str()
+            memory_info = self.get_memory_usage(device_id)
+            if i:
+                buf.write("\n")
+            buf.write(f"[{timestamp}] 第 {i + 1} 次采样\n{memory_info}")
+            next_deadline += interval
+            time.sleep(max(0.0, next_deadline - time.monotonic()))
+        return buf.getvalue()
+
+
+class AdvancedPerformanceMonitor:
+    """按应用维度的性能指标监控(结构化输出)"""
+
+    @_ttl_cache(maxsize=64, ttl=0.5)
+    def get_memory_info(self, package_name, device_id=None):
+        """获取应用内存详情 (dumpsys meminfo)"""
+        memory_data = {
+            "timestamp": _now_str(),
+            "metrics": {"memory": {}},
+            "success": False,
+        }
+        try:
+            # --proto 比人类可读文本小一个量级且免正则; 仅在设备支持
+            # 且本地有生成的 protobuf 绑定时启用
+            if _HAS_MEMINFO_PROTO and _caps(device_id)["meminfo_proto"]:
+                try:
+                    raw = subprocess.run(
+                        _adb_argv(device_id, "shell", "dumpsys", "meminfo",
+                                  "--proto", package_name),
+                        capture_output=True, timeout=_ADB_DEFAULT_TIMEOUT).stdout
+                    proto = MemInfoDumpProto()
+                    proto.ParseFromString(raw)
+                    target = memory_data["metrics"]["memory"]
+                    target["java_heap_mb"] = proto.java_heap_kb / 1024
+                    target["native_heap_mb"] = proto.native_heap_kb / 1024
+                    target["graphics_mb"] = proto.graphics_kb / 1024
+                    target["total_pss_mb"] = proto.total_pss_kb / 1024
+                    memory_data["success"] = True
+                    return memory_data
+                except Exception:
+                    # 嗅探误判或输出损坏时不报失败, 落回文本路径
+                    pass
+
+            result = _adb_shell_run(
+                f"dumpsys meminfo {shlex.quote(package_name)} | "
+                "grep -E '(Java Heap|Native Heap|Graphics|TOTAL PSS):'",
+                device_id)
+            memory_data["metrics"]["memory"] = self._memory_metrics_from_text(result)
+            memory_data["success"] = bool(memory_data["metrics"]["memory"])
+            return memory_data
+        except Exception as e:
+            memory_data["error"] = str(e)
+            return memory_data
+
+    @staticmethod
+    def _memory_metrics_from_text(raw):
+        # 单次 C 层 finditer 扫全文, 免去逐行 in 判断和重复 re.search
+        return {_MEMINFO_KEYS[m.group(1)]: int(m.group(2)) / 1024
+                for m in _RE_MEMINFO.finditer(raw)}
+
+    def get_cpu_usage_by_package(self, package_name, device_id=None):
+        """获取指定应用的 CPU 占用"""
+        cpu_data = {
+            "timestamp": _now_str(),
+            "metrics": {"cpu": {}},
+            "success": False,
+        }
+        try:
+            # 过滤放在设备侧, 只回传包名命中的那一行而不是整份 top
+            cmd = (f"{_top_command(device_id)} | "
+                   f"grep -F {shlex.quote(package_name)} | head -n 1")
+            cpu_data["metrics"]["cpu"] = self._cpu_metrics_from_top(
+                _adb_shell_cached(device_id, cmd))
+            cpu_data["success"] = bool(cpu_data["metrics"]["cpu"])
+            return cpu_data
+        except Exception as e:
+            cpu_data["error"] = str(e)
+            return cpu_data
+
+    @staticmethod
+    def _cpu_metrics_from_top(raw):
+        """按列位解析 top 进程行的 CPU 占用
+
+        旧版 top 的 CPU 列带 % 后缀, 优先按后缀定位; 否则是
+        -o PID,%CPU,CMDLINE 的定列输出, %CPU 固定在第 2 列。
+        """
+        parts = raw.strip().split()
+        for part in parts:
+            if part.endswith("%") and _RE_NUMBER.fullmatch(part[:-1]):
+                return {"cpu_percent": float(part[:-1])}
+        if len(parts) >= 2 and _RE_NUMBER.fullmatch(parts[1]):
+            return {"cpu_percent": float(parts[1])}
+        return {}
+
+    def get_battery_info(self, device_id=None):
+        """获取电池详情"""
+        battery_data = {
+            "timestamp": _now_str(),
+            "metrics": {"battery": {}},
+            "success": False,
+        }
+        try:
+            battery_data["metrics"]["battery"] = self._battery_metrics_from_raw(
+                _adb_shell_cached(device_id, "dumpsys battery"))
+            battery_data["success"] = bool(battery_data["metrics"]["battery"])
+            return battery_data
+        except Exception as e:
+            battery_data["error"] = str(e)
+            return battery_data
+
+    @staticmethod
+    def _battery_metrics_from_raw(raw):
+        metrics = {}
+        for field, value in _parse_battery(raw).items():
+            if field == "temperature":
+                metrics["temperature_c"] = value / 10
+            else:
+                metrics[field] = value
+        return metrics
+
+    def get_fps_info(self, package_name, device_id=None):
+        """获取应用帧率统计 (dumpsys gfxinfo)"""
+        fps_data = {
+            "timestamp": _now_str(),
+            "metrics": {"fps": {}},
+            "success": False,
+        }
+        try:
+            result = _adb_shell_run(f"dumpsys gfxinfo {package_name} framestats",
+                                    device_id)
+            fps_data["metrics"]["fps"] = self._fps_metrics_from_framestats(result)
+            fps_data["success"] = bool(fps_data["metrics"]["fps"])
+            return fps_data
+        except Exception as e:
+            fps_data["error"] = str(e)
+            return fps_data
+
+    @staticmethod
+    def _fps_metrics_from_framestats(raw):
+        # framestats 可达数万帧, 聚合交给 NumPy 的 C 循环:
+        # 一次解析进连续 float64 缓冲, mean/比较/分位数都是向量化单趟
+        tokens = [tok for line in _RE_FRAME_LINE.findall(raw)
+                  for tok in _RE_NUM_TOKEN.findall(line)]
+        if not tokens:
+            return {}
+        arr = np.asarray(tokens, dtype=np.float64)
+        avg_frame_time, jank_count, min_ft, max_ft = _fps_stats(arr)
+        avg_frame_time = float(avg_frame_time)
+        p90, p99 = np.percentile(arr, (90, 99))
+        return {
+            "avg_frame_time_ms": avg_frame_time,
+            "estimated_fps": 1000.0 / avg_frame_time if avg_frame_time > 0 else 0,
+            "jank_count": int(jank_count),
+            "min_frame_time_ms": float(min_ft),
+            "max_frame_time_ms": float(max_ft),
+            "p90_frame_time_ms": float(p90),
+            "p99_frame_time_ms": float(p99),
+        }
+
+    def get_network_traffic(self, package_name, device_id=None):
+        """获取应用网络流量"""
+        net_data = {
+            "timestamp": _now_str(),
+            "metrics": {"network": {}},
+            "success": False,
+        }
+        try:
+            result = _adb_shell_run("cat /proc/net/xt_qtaguid/stats", device_id)
+            # 流量表可达数千行, rx/tx 列抽成 int64 数组后向量化求和
+            values = (int(parts[col])
+                      for line in result.splitlines() if package_name in line
+                      for parts in (line.split(),) if len(parts) > 7
+                      for col in (5, 7))
+            arr = np.fromiter(values, dtype=np.int64).reshape(-1, 2)
+            rx_bytes, tx_bytes = (arr.sum(axis=0) if arr.size else (0, 0))
+            net_data["metrics"]["network"]["rx_kb"] = int(rx_bytes) / 1024
+            net_data["metrics"]["network"]["tx_kb"] = int(tx_bytes) / 1024
+            net_data["success"] = True
+            return net_data
+        except Exception as e:
+            net_data["error"] = str(e)
+            return net_data
+
+    def get_app_startup_time(self, package_name, activity_name, device_id=None):
+        """测量应用冷启动耗时 (am start -W)"""
+        startup_data = {
+            "timestamp": _now_str(),
+            "metrics": {"startup": {}},
+            "success": False,
+        }
+        try:
+            subprocess.run(
+                _adb_argv(device_id, "shell", "am", "force-stop", package_name),
+                capture_output=True, timeout=_ADB_DEFAULT_TIMEOUT)
+            result = subprocess.check_output(
+                _adb_argv(device_id, "shell", "am", "start", "-W",
+                          f"{package_name}/{activity_name}"), text=True,
+                timeout=_ADB_STARTUP_TIMEOUT)
+            for match in _RE_STARTUP.finditer(result):
+                startup_data["metrics"]["startup"][_STARTUP_KEYS[match.group(1)]] = (
+                    int(match.group(2)))
+            startup_data["success"] = bool(startup_data["metrics"]["startup"])
+            return startup_data
+        except Exception as e:
+            startup_data["error"] = str(e)
+            return startup_data
+
+    def _metric_commands(self, package_name, device_id=None):
+        """指标名 -> (设备侧命令, 解析器), 命令可合并进一次批量 shell
+
+        内存走文本 grep 管道: --proto 是二进制输出, 没法和其他文本
+        命令拼在同一条管道里, 单独采内存时仍可用 get_memory_info。
+        """
+        quoted = shlex.quote(package_name)
+        top_cmd = _top_command(device_id)
+        return {
+            "memory": (f"dumpsys meminfo {quoted} | "
+                       "grep -E '(Java Heap|Native Heap|Graphics|TOTAL PSS):'",
+                       self._memory_metrics_from_text),
+            "cpu": (f"{top_cmd} | grep -F {quoted} | head -n 1",
+                    self._cpu_metrics_from_top),
+            "fps": (f"dumpsys gfxinfo {quoted} framestats",
+                    self._fps_metrics_from_framestats),
+            "battery": ("dumpsys battery", self._battery_metrics_from_raw),
+        }
+
+    def get_performance_snapshot(self, package_name, device_id=None, metrics=None):
+        """采集一次性能快照, 默认包含内存/CPU/FPS/电池
+
+        所有探针命令拼进一次批量 shell: 每次采样只付一个 adb 往返,
+        回来后在本地按段分别解析。
+        """
+        if metrics is None:
+            metrics = ["memory", "cpu", "fps", "battery"]
+        snapshot = {
+            # 快照内部用 epoch 浮点时间戳, 采样路径零格式化开销;
+            # 只在对外输出(timeline)时经 _format_ts 转成可读串
+            "timestamp": time.time(),
+            "package": package_name,
+            "metrics": {},
+            "anomalies": [],
+            "success": True,
+        }
+        try:
+            table = self._metric_commands(package_name, device_id)
+            tasks = [(name,) + table[name] for name in metrics if name in table]
+            blocks = _run_adb_shell_batch(device_id, [cmd for _, cmd, _ in tasks])
+            for (name, _, parse), raw in zip(tasks, blocks):
+                parsed = parse(raw)
+                if parsed:
+                    snapshot["metrics"][name] = parsed
+
+            snapshot["anomalies"] = self._detect_anomalies(snapshot["metrics"])
+            snapshot["success"] = bool(snapshot["metrics"])
+            return snapshot
+        except Exception as e:
+            snapshot["success"] = False
+            snapshot["error"] = str(e)
+            return snapshot
+
+    @staticmethod
+    def _detect_anomalies(metrics):
+        """根据阈值识别异常指标"""
+        anomalies = []
+        memory = metrics.get("memory", {})
+        if memory.get("total_pss_mb", 0) > 500:
+            anomalies.append(f"内存占用过高: {memory['total_pss_mb']:.1f}MB")
+        cpu = metrics.get("cpu", {})
+        if cpu.get("cpu_percent", 0) > 80:
+            anomalies.append(f"CPU 占用过高: {cpu['cpu_percent']:.1f}%")
+        fps = metrics.get("fps", {})
+        if fps.get("jank_count", 0) > 10:
+            anomalies.append(f"卡顿次数过多: {fps['jank_count']}")
+        return anomalies
+
+    def monitor_performance(self, package_name, duration=60, interval=5,
+                            device_id=None, persist=None):
+        """持续监控应用性能并生成汇总报告
+
+        persist 传入可调用对象时, 每个快照经 _pack_snapshot 打包成
+        二进制字节后交给它(如写文件或发 socket), 监控本身不落盘。
+        """
+        # 指标缓冲按预期采样数一次分配, 采样期按下标写入而非 append 扩容;
+        # 缺失指标记 NaN, 汇总前统一过滤
+        capacity = int(duration / interval) + 1
+        mem_arr = np.full(capacity, np.nan)
+        cpu_arr = np.full(capacity, np.nan)
+        fps_arr = np.full(capacity, np.nan)
+        # 快照按"三列数组 + 计数器"的 SoA 形态就地落库, 整份快照字典
+        # 用完即弃; timeline/alerts 在采样时顺手生成, 结束后不再重扫,
+        # alerts 用定长 deque 兜底, 异常风暴下只保留最近一万条
+        timeline = []
+        alerts = deque(maxlen=10_000)
+        filled = 0
+        # 成功数/异常数在采样时就地累加, 汇总阶段 O(1) 直接取用
+        success_count = 0
+        anomaly_count = 0
+        # 逐轮扣 elapsed 只能防止周期拉长, 误差仍会累积;
+        # 固定 deadline 递增保证第 k 次采样始终落在 start + k*interval
+        start = time.monotonic()
+        next_deadline = start
+        while time.monotonic() - start < duration:
+            _invalidate_raw_cache()
+            snapshot = self.get_performance_snapshot(package_name, device_id)
+            if persist is not None:
+                persist(_pack_snapshot(snapshot))
+            if filled == mem_arr.size:
+                # 单次采样慢于 interval 时实际次数会超预估, 按倍扩容
+                mem_arr = np.concatenate([mem_arr, np.full(mem_arr.size, np.nan)])
+                cpu_arr = np.concatenate([cpu_arr, np.full(cpu_arr.size, np.nan)])
+                fps_arr = np.concatenate([fps_arr, np.full(fps_arr.size, np.nan)])
+            metrics = snapshot.get("metrics", {})
+            mem_arr[filled] = metrics.get("memory", {}).get("total_pss_mb", np.nan)
+            cpu_arr[filled] = metrics.get("cpu", {}).get("cpu_percent", np.nan)
+            fps_arr[filled] = metrics.get("fps", {}).get("estimated_fps", np.nan)
+            filled += 1
+            timeline.append({
+                "iteration": filled,
+                "timestamp": _format_ts(snapshot["timestamp"]),
+                "metrics": metrics,
+            })
+            if snapshot.get("success"):
+                success_count += 1
+            anomalies = snapshot.get("anomalies")
+            if anomalies:
+                alerts.extend(anomalies)
+                anomaly_count += len(anomalies)
+            next_deadline += interval
+            time.sleep(max(0.0, next_deadline - time.monotonic()))
+
+        series = tuple(col[np.isfinite(col)] for col in
+                       (mem_arr[:filled], cpu_arr[:filled], fps_arr[:filled]))
+        return {
+            "package": package_name,
+            "duration": duration,
+            "interval": interval,
+            "summary": self._generate_summary(
+                None, series, (filled, success_count, anomaly_count)),
+            "trends": self._analyze_performance_trends(
+                None, series, anomaly_count),
+            "timeline": timeline,
+            "alerts": list(alerts),
+        }
+
+    def monitor_performance_multi(self, package_name, device_ids,
+                                  duration=60, interval=5):
+        """并行监控多台设备, 返回 {device_id: 监控报告}
+
+        adb 调用是 IO 等待且 subprocess 期间释放 GIL, 每台设备一个
+        线程就能把 N 台的墙钟时间压到约单台水平; 各设备的长驻 shell
+        会话、指标缓冲和计数器都是每次调用的局部状态, 互不共享。
+        """
+        with ThreadPoolExecutor(max_workers=max(len(device_ids), 1)) as ex:
+            futures = [
+                (device_id, ex.submit(self.monitor_performance, package_name,
+                                      duration, interval, device_id))
+                for device_id in device_ids
+            ]
+            return {device_id: future.result() for device_id, future in futures}
+
+    @staticmethod
+    def _extract_metric_series(performance_history):
+        """把快照历史抽成 (内存, CPU, FPS) 三条 ndarray, 供汇总与趋势共用
+
+        单次遍历同时填三条序列: 每个快照只取一次 metrics 字典,
+        历史再长也只扫一遍。
+        """
+        memory_values = []
+        cpu_values = []
+        fps_values = []
+        for snapshot in performance_history:
+            if not snapshot.get("success"):
+                continue
+            metrics = snapshot.get("metrics", {})
+            memory = metrics.get("memory")
+            if memory and "total_pss_mb" in memory:
+                memory_values.append(memory["total_pss_mb"])
+            cpu = metrics.get("cpu")
+            if cpu and "cpu_percent" in cpu:
+                cpu_values.append(cpu["cpu_percent"])
+            fps = metrics.get("fps")
+            if fps and "estimated_fps" in fps:
+                fps_values.append(fps["estimated_fps"])
+        return (np.asarray(memory_values, dtype=np.float64),
+                np.asarray(cpu_values, dtype=np.float64),
+                np.asarray(fps_values, dtype=np.float64))
+
+    def _generate_summary(self, performance_history, series=None, counts=None):
+        """汇总监控数据的统计摘要
+
+        采样循环维护了 (总数, 成功数, 异常数) 时经 counts 传入,
+        此时不需要快照列表(传 None 即可), 汇总本身就是 O(1);
+        否则退化为对 performance_history 的单趟重扫。
+        """
+        if counts is not None:
+            total, successful, total_anomalies = counts
+            if not total:
+                return dict(_EMPTY_SUMMARY)
+            mem, cpu, fps = series
+        else:
+            if not performance_history:
+                return dict(_EMPTY_SUMMARY)
+            total = len(performance_history)
+            if series is None:
+                series = self._extract_metric_series(performance_history)
+            mem, cpu, fps = series
+            # 成功数与异常数在同一趟循环里数完, get 的结果先绑定到局部变量
+            successful = 0
+            total_anomalies = 0
+            for snapshot in performance_history:
+                if snapshot.get("success"):
+                    successful += 1
+                anomalies = snapshot.get("anomalies")
+                if anomalies:
+                    total_anomalies += len(anomalies)
+        # 均值在 ndarray 上一次 C 层归约, 不再逐元素累加 Python float
+        return {
+            "total_snapshots": total,
+            "successful_snapshots": successful,
+            "total_anomalies": total_anomalies,
+            "average_memory_mb": float(mem.mean()) if mem.size else 0.0,
+            "average_cpu_percent": float(cpu.mean()) if cpu.size else 0.0,
+            "average_fps": float(fps.mean()) if fps.size else 0.0,
+        }
+
+    def _analyze_performance_trends(self, performance_history, series=None,
+                                    anomaly_count=None):
+        """分析监控期间的性能趋势
+
+        监控路径只传 SoA 序列和现成计数, performance_history 可为 None。
+        """
+        trends = {
+            "memory_trend": "stable",
+            "anomaly_count": 0,
+        }
+        if anomaly_count is not None:
+            trends["anomaly_count"] = anomaly_count
+        elif performance_history:
+            trends["anomaly_count"] = sum(
+                len(s.get("anomalies", ())) for s in performance_history)
+        total = (len(performance_history) if performance_history is not None
+                 else (series[0].size if series is not None else 0))
+        if total < 2:
+            return trends
+        if series is not None:
+            mem = series[0]
+            if mem.size < 2:
+                return trends
+            # 端点比值对首尾噪声敏感; 有完整序列时用最小二乘斜率判趋势
+            # (装了 numba 时斜率在 JIT 单趟循环里算, 否则 NumPy 闭式解)
+            slope = float(_series_slope(mem))
+            baseline = float(mem[0]) or float(mem.mean()) or 1.0
+            rel_change = slope * (mem.size - 1) / baseline
+            if rel_change > 0.2:
+                trends["memory_trend"] = "increasing"
+            elif rel_change < -0.2:
+                trends["memory_trend"] = "decreasing"
+            return trends
+        else:
+            # 趋势只看首尾两个点, 从两端定向扫描即可, 不物化整条序列
+            def _mem_of(snapshot):
+                if not snapshot.get("success"):
+                    return None
+                return snapshot.get("metrics", {}).get("memory", {}).get("total_pss_mb")
+
+            first_mem = next((v for v in map(_mem_of, performance_history)
+                              if v is not None), None)
+            last_mem = next((v for v in map(_mem_of, reversed(performance_history))
+                             if v is not None), None)
+            if first_mem is None or last_mem is None:
+                return trends
+        if last_mem > first_mem * 1.2:
+            trends["memory_trend"] = "increasing"
+        elif last_mem < first_mem * 0.8:
+            trends["memory_trend"] = "decreasing"
+        return trends
+
+
+if __name__ == "__main__":
+    monitor = AdvancedPerformanceMonitor()
+    package = "com.example.app"
+
+    print(_dumps(monitor.get_memory_info(package)))
+    print(_dumps(monitor.get_cpu_usage_by_package(package)))
+    print(_dumps(monitor.get_performance_snapshot(package)))
+    print(_dumps(monitor.monitor_performance(package, duration=15, interval=5)))
@@ -0,0 +1,644 @@
+"""自动化测试 Agent
+
+基于 LangGraph 的测试代理: LLM 负责规划与决策, 设备操作、
+性能采集、知识检索等能力以工具形式暴露给模型调用。
+"""
+
+import functools
+import re
+import threading
+import time
+from collections import deque
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import tool
+from langgraph.graph import END, MessagesState, StateGraph
+
+from adb_tools import (AdbUITools, AdvancedPerformanceMonitor,
+                       DeviceInfoCollector, PerformanceMonitor)
+from appium_tools import AppiumUITools
+from knowledge_base import VectorKnowledgeBase
+
+primary_model = ChatAnthropic(model="claude-3-5-sonnet-20241022", temperature=0)
+
+_adb_ui = AdbUITools()
+_device_collector = DeviceInfoCollector()
+_perf_monitor = AdvancedPerformanceMonitor()
+_basic_monitor = PerformanceMonitor()
+# Appium 会话建立很贵, 工具间共享同一个包装实例复用 driver
+_appium = AppiumUITools()
+
+
+# ---------------------------------------------------------------------------
+# API 限速与重试
+
+# 每个 provider 一个令牌桶: 桶内是最近请求的时间戳环,
+# 锁粒度从"全部 API 调用共用一把"降到桶级, 不同 provider 互不阻塞
+_RATE_WINDOW = 60.0
+_RATE_LIMIT = 60
+
+# 重试分类器: 预编译正则一趟扫完错误串, 免去逐关键字 in 判断
+# 和每次分支各做一份 .lower() 拷贝
+_RATE_RE = re.compile(r"RateLimitError|429|TPM|quota|limit", re.I)
+_TIMEOUT_RE = re.compile(r"time ?d? ?out", re.I)
+_SERVER_RE = re.compile(r"50[023]|server", re.I)
+
+
+class _TokenBucket:
+    """滑动窗口限速桶"""
+
+    def __init__(self, rate=_RATE_LIMIT, window=_RATE_WINDOW):
+        self.rate = rate
+        self.window = window
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞到拿到一个请求名额"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._stamps and now - self._stamps[0] >= self.window:
+                    self._stamps.popleft()
+                if len(self._stamps) < self.rate:
+                    self._stamps.append(now)
+                    return
+                wait = self.window - (now - self._stamps[0])
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket_for(model):
+    """按底层模型类取对应限速桶, 懒初始化
+
+    bind_tools 的产物是 RunnableBinding 包装, 解包到被绑定的
+    模型再取类名, 绑定前后两条调用路径共享同一凭证的配额。
+    """
+    while hasattr(model, "bound"):
+        model = model.bound
+    key = model.__class__.__name__
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _TokenBucket()
+            _buckets[key] = bucket
+        return bucket
+
+
+def api_call_with_retry(max_retries=3, backoff=2.0):
+    """限速 + 指数退避重试装饰器, 第一个参数须是模型实例"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(model, *args, **kwargs):
+            last_error = None
+            for attempt in range(max_retries):
+                _bucket_for(model).acquire()
+                try:
+                    return fn(model, *args, **kwargs)
+                except Exception as e:
+                    last_error = e
+                    error_str = str(e)
+                    if _RATE_RE.search(error_str):
+                        time.sleep(backoff * (2 ** attempt))
+                    elif (_TIMEOUT_RE.search(error_str)
+                          or _SERVER_RE.search(error_str)):
+                        time.sleep(backoff)
+                    else:
+                        raise
+            raise RuntimeError(f"API 调用重试 {max_retries} 次仍失败: {last_error}")
+        return wrapper
+    return decorator
+
+
+@api_call_with_retry()
+def _invoke_model(model, messages):
+    """经限速与重试保护的模型调用入口"""
+    return model.invoke(messages)
+
+
+# ---------------------------------------------------------------------------
+# 批量提交
+
+class LLMBatcher:
+    """把短窗口内的模型调用攒成一批提交
+
+    一次测试会话往往连发 N 条规划请求, 逐条打 API 就是 N 个串行
+    RTT。submit 立即返回 Future; 后台在窗口关闭(50ms)或攒满
+    batch_size 时把同一模型的请求经 model.batch 并行发出,
+    省掉的是逐条串行的往返等待。
+    """
+
+    def __init__(self, batch_window=0.05, batch_size=10):
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def submit(self, model, messages):
+        future = Future()
+        with self._lock:
+            self._pending.append((model, messages, future))
+            batch = (self._drain_locked()
+                     if len(self._pending) >= self.batch_size else None)
+            if batch is None and self._timer is None:
+                self._timer = threading.Timer(self.batch_window, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run_batch(batch)
+        return future
+
+    def _drain_locked(self):
+        batch = self._pending
+        self._pending = []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush(self):
+        with self._lock:
+            batch = self._drain_locked()
+        if batch:
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # 按模型实例分组, 同组经 provider 的批量端点一次发出
+        by_model = {}
+        for model, messages, future in batch:
+            by_model.setdefault(id(model), (model, []))[1].append(
+                (messages, future))
+        for model, items in by_model.values():
+            # .batch 底层是 N 个并行 invoke, 对 provider 就是 N 个
+            # 真实请求, 限速名额按条收取, 不给限速器开后门
+            bucket = _bucket_for(model)
+            for _ in items:
+                bucket.acquire()
+            try:
+                results = model.batch([messages for messages, _ in items])
+                for (_, future), result in zip(items, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+_batcher = LLMBatcher()
+
+
+# ---------------------------------------------------------------------------
+# 知识库单例
+
+# VectorKnowledgeBase 初始化要加载嵌入模型与索引, 冷启动远贵于一次
+# 检索; 全模块共用一个懒初始化实例, 双重检查锁避免读路径拿锁
+_KB_SINGLETON = None
+_kb_init_lock = threading.Lock()
+
+
+def _get_kb():
+    global _KB_SINGLETON
+    if _KB_SINGLETON is None:
+        with _kb_init_lock:
+            if _KB_SINGLETON is None:
+                _KB_SINGLETON = VectorKnowledgeBase()
+    return _KB_SINGLETON
+
+
+# ---------------------------------------------------------------------------
+# LLM 响应缓存
+
+class SemanticLLMCache:
+    """LLM 响应的语义缓存
+
+    规划类工具的 prompt 高度模板化, 重复或换种说法的需求没必要
+    重新打 API: 先走 O(1) 精确匹配, 未命中再嵌入 prompt 与历史
+    做余弦相似度, 达到阈值直接复用旧响应。
+    """
+
+    def __init__(self, threshold=0.93, maxsize=256):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._exact = {}
+        self._responses = []
+        self._embeddings = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _embed(prompt):
+        # 复用知识库单例的嵌入模型, 不单独再加载一份
+        return _get_kb().embed(prompt)
+
+    def invoke(self, model, messages):
+        """带缓存的模型调用, 以消息文本拼接为键"""
+        prompt = "\n".join(str(m.content) for m in messages)
+        cached = self._exact.get(prompt)
+        if cached is not None:
+            return cached
+        vec = self._embed(prompt)
+        with self._lock:
+            if self._embeddings is not None:
+                norms = (np.linalg.norm(self._embeddings, axis=1)
+                         * np.linalg.norm(vec)) + 1e-12
+                sims = self._embeddings @ vec / norms
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    return self._responses[best]
+        # 未命中缓存的请求经批量器提交, 并发的规划调用合并成一批
+        response = _batcher.submit(model, messages).result()
+        with self._lock:
+            if len(self._responses) >= self.maxsize:
+                # 满了整体清空; 语义缓存里淘汰策略远不如命中率重要
+                self._exact.clear()
+                self._responses.clear()
+                self._embeddings = None
+            self._exact[prompt] = response
+            self._responses.append(response)
+            self._embeddings = (
+                vec[np.newaxis, :] if self._embeddings is None
+                else np.vstack([self._embeddings, vec]))
+        return response
+
+
+# 四个规划类工具共享同一份缓存
+_llm_cache = SemanticLLMCache()
+
+
+# ---------------------------------------------------------------------------
+# 会话记忆
+
+class ConversationMemory:
+    """跨工具调用共享的会话上下文"""
+
+    def __init__(self):
+        self.context_vars = {}
+        self.sessions = {}
+        self.history = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    def set_var(self, key, value):
+        with self._lock:
+            self.context_vars[key] = value
+
+    def get_var(self, key, default=None):
+        with self._lock:
+            return self.context_vars.get(key, default)
+
+    def record_session(self, session_id, info):
+        with self._lock:
+            self.sessions[session_id] = info
+
+    def append_history(self, entry):
+        with self._lock:
+            self.history.append(entry)
+
+    def snapshot(self):
+        """上下文的浅拷贝快照, 读方在锁外随便遍历/格式化"""
+        with self._lock:
+            return dict(self.context_vars)
+
+    def get_session(self, session_id, default=None):
+        with self._lock:
+            return self.sessions.get(session_id, default)
+
+    def sessions_snapshot(self):
+        with self._lock:
+            return dict(self.sessions)
+
+
+test_memory = ConversationMemory()
+
+
+# ---------------------------------------------------------------------------
+# LLM 规划类工具
+
+@tool
+def create_test_plan(requirement: str) -> str:
+    """根据需求描述生成结构化测试计划"""
+    messages = [
+        SystemMessage(content="你是资深移动端测试工程师, 输出结构化测试计划。"),
+        HumanMessage(content=f"针对以下需求制定测试计划:\n{requirement}"),
+    ]
+    response = _llm_cache.invoke(primary_model, messages)
+    test_memory.set_var("last_test_plan", response.content)
+    return response.content
+
+
+@tool
+def create_test_case(test_scenario: str) -> str:
+    """根据测试场景生成可执行的测试用例"""
+    messages = [
+        SystemMessage(content="你是资深移动端测试工程师, 输出带步骤与预期的测试用例。"),
+        HumanMessage(content=f"针对以下场景编写测试用例:\n{test_scenario}"),
+    ]
+    response = _llm_cache.invoke(primary_model, messages)
+    test_memory.append_history(("create_test_case", test_scenario))
+    return response.content
+
+
+@tool
+def validate_test_result(expected: str, actual: str) -> str:
+    """比对预期与实际结果, 给出通过/失败结论及原因"""
+    messages = [
+        SystemMessage(content="你是测试结果判定助手, 先给结论再给依据。"),
+        HumanMessage(content=f"预期结果:\n{expected}\n\n实际结果:\n{actual}"),
+    ]
+    response = _llm_cache.invoke(primary_model, messages)
+    return response.content
+
+
+@tool
+def generate_test_report(session_id: str) -> str:
+    """汇总指定测试会话, 生成测试报告"""
+    info = test_memory.get_session(session_id, {})
+    messages = [
+        SystemMessage(content="你是测试报告撰写助手, 输出简洁的结构化报告。"),
+        HumanMessage(content=f"会话 {session_id} 的记录如下, 请生成报告:\n{info}"),
+    ]
+    response = _llm_cache.invoke(primary_model, messages)
+    return response.content
+
+
+# ---------------------------------------------------------------------------
+# 知识库工具
+
+@functools.lru_cache(maxsize=512)
+def _search_kb_formatted(query):
+    """检索并格式化, 同一 query 的重复调用走精确记忆化"""
+    results = _get_kb().search(query, top_k=5)
+    if not results:
+        return "知识库中没有相关条目"
+    # 列表攒段 + 一次 join, 循环里不再反复分配新字符串
+    parts = [f"知识库检索结果 (query={query}):"]
+    for i, (doc, score) in enumerate(results, 1):
+        parts.append(f"{i}. [{score:.2f}] {doc}")
+    return "\n".join(parts)
+
+
+@tool
+def search_knowledge_base(query: str) -> str:
+    """在测试知识库中检索相关条目"""
+    return _search_kb_formatted(query)
+
+
+# ---------------------------------------------------------------------------
+# 会话状态工具
+
+@tool
+def get_test_progress() -> str:
+    """查看当前测试进度"""
+    # 锁内只做一次 O(1) 浅拷贝, 遍历与格式化都在锁外进行
+    context = test_memory.snapshot()
+    if not context:
+        return "尚未记录任何测试上下文"
+    parts = ["当前测试进度:"]
+    for key, value in context.items():
+        parts.append(f"- {key}: {value}")
+    return "\n".join(parts)
+
+
+@tool
+def get_test_context(key: str = "") -> str:
+    """读取测试上下文变量, 不传 key 时列出全部"""
+    if key:
+        value = test_memory.get_var(key)
+        return f"{key}: {value}" if value is not None else f"上下文中没有 {key}"
+    context = test_memory.snapshot()
+    parts = ["测试上下文:"]
+    for name, value in context.items():
+        parts.append(f"- {name}: {value}")
+    return "\n".join(parts)
+
+
+@tool
+def list_test_sessions() -> str:
+    """列出已记录的测试会话"""
+    sessions = test_memory.sessions_snapshot()
+    if not sessions:
+        return "暂无测试会话"
+    parts = ["测试会话列表:"]
+    for session_id, info in sessions.items():
+        parts.append(f"- {session_id}: {info.get('status', '未知状态')}")
+    return "\n".join(parts)
+
+
+@tool
+def run_regression_test(case_ids: str) -> str:
+    """按逗号分隔的用例 ID 批量执行回归"""
+    parts = ["回归测试结果:"]
+    for case_id in case_ids.split(","):
+        case_id = case_id.strip()
+        if not case_id:
+            continue
+        case = test_memory.get_var(f"case_{case_id}")
+        if case is None:
+            parts.append(f"- {case_id}: 未找到用例")
+            continue
+        test_memory.append_history(("regression", case_id))
+        parts.append(f"- {case_id}: 已加入执行队列")
+    return "\n".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# 设备操作工具
+
+@tool
+def connect_devices(device_id: str = "") -> str:
+    """连接 Appium 设备会话"""
+    return _appium.connect(device_id or None)
+
+
+@tool
+def swipe_screen(direction: str, device_id: str = "") -> str:
+    """按方向滑动屏幕 (up/down/left/right)"""
+    return _appium.swipe(direction, device_id or None)
+
+
+@tool
+def press_key(key: str, device_id: str = "") -> str:
+    """按下系统按键 (back/home/menu/enter 等)"""
+    return _appium.press_key(key, device_id or None)
+
+
+@tool
+def click_element(element_num: int, device_id: str = "") -> str:
+    """按编号点击当前界面元素"""
+    return _adb_ui.tap_element(element_num, device_id or None)
+
+
+@tool
+def input_text(text: str, device_id: str = "") -> str:
+    """向当前焦点控件输入文本"""
+    return _adb_ui.input_text(text, device_id or None)
+
+
+@tool
+def get_device_info(device_id: str = "") -> str:
+    """采集设备基础信息"""
+    return _device_collector.collect_info(device_id or None)
+
+
+# ---------------------------------------------------------------------------
+# 性能监控工具
+
+@tool
+def get_battery_status(device_id: str = "") -> str:
+    """查询设备电池状态"""
+    return _basic_monitor.get_battery_status(device_id or None)
+
+
+@tool
+def get_logcat(keyword: str = "", device_id: str = "") -> str:
+    """抓取设备日志, 可按关键字过滤"""
+    return _basic_monitor.get_logcat(keyword or None, device_id or None)
+
+
+@tool
+def get_memory_info(package_name: str, device_id: str = "") -> str:
+    """获取应用内存占用详情"""
+    return str(_perf_monitor.get_memory_info(package_name, device_id or None))
+
+
+@tool
+def get_cpu_usage_by_package(package_name: str, device_id: str = "") -> str:
+    """获取应用 CPU 占用"""
+    return str(_perf_monitor.get_cpu_usage_by_package(
+        package_name, device_id or None))
+
+
+@tool
+def get_fps_info(package_name: str, device_id: str = "") -> str:
+    """获取应用帧率统计"""
+    return str(_perf_monitor.get_fps_info(package_name, device_id or None))
+
+
+@tool
+def get_performance_snapshot(package_name: str, device_id: str = "") -> str:
+    """采集应用性能快照(内存/CPU/FPS/电池)"""
+    # 底层 get_performance_snapshot 已把四个探针命令拼进同一次
+    # 批量 shell, 整个快照只付一个 adb 往返, 不再逐项各打一次
+    snapshot = _perf_monitor.get_performance_snapshot(
+        package_name, device_id or None)
+    parts = [f"{package_name} 性能快照:"]
+    for name, label in (("memory", "内存"), ("cpu", "CPU"),
+                        ("fps", "帧率"), ("battery", "电池")):
+        metrics = snapshot["metrics"].get(name)
+        if metrics:
+            parts.append(f"[{label}] {metrics}")
+    anomalies = snapshot.get("anomalies")
+    if anomalies:
+        parts.append("异常: " + "; ".join(anomalies))
+    return "\n".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# 图组装
+
+# 可安全并发的工具 (纯 adb/检索或内部已自带锁, 不改设备状态);
+# @tool 产物是 pydantic 模型, 不接受自定义属性, 安全名单放这里。
+# 规划类工具也在内: 它们的共享状态 ConversationMemory 自带锁,
+# 并发提交才能落进 LLMBatcher 的攒批窗口, 否则全是单条批
+_CONCURRENT_SAFE_TOOLS = frozenset({
+    "create_test_plan", "create_test_case", "validate_test_result",
+    "generate_test_report",
+    "search_knowledge_base", "get_test_progress", "get_test_context",
+    "list_test_sessions", "get_device_info", "get_battery_status",
+    "get_logcat", "get_memory_info", "get_cpu_usage_by_package",
+    "get_fps_info", "get_performance_snapshot",
+})
+
+
+class ConcurrentToolNode:
+    """并发执行同一轮的多个工具调用
+
+    模型一轮经常同时请求 3-5 个互相独立的采集工具, 串行执行的
+    延迟是各项之和; 只读工具丢进线程池并行跑(墙钟降到最慢一项),
+    变更设备状态的工具按 device_id 拿锁, 同一台设备仍串行。
+    """
+
+    def __init__(self, tools, max_workers=8):
+        self._tools = {t.name: t for t in tools}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._device_locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _device_lock(self, device_id):
+        with self._locks_guard:
+            lock = self._device_locks.get(device_id)
+            if lock is None:
+                lock = self._device_locks[device_id] = threading.Lock()
+            return lock
+
+    def _run_call(self, call):
+        tool_obj = self._tools[call["name"]]
+        args = call.get("args", {})
+        try:
+            if call["name"] in _CONCURRENT_SAFE_TOOLS:
+                content = tool_obj.invoke(args)
+            else:
+                with self._device_lock(args.get("device_id") or None):
+                    content = tool_obj.invoke(args)
+        except Exception as e:
+            # 工具抛错转成错误消息回给模型自行处理,
+            # 不让单个工具失败中断整轮图执行
+            content = f"工具 {call['name']} 执行失败: {e}"
+        return ToolMessage(content=str(content), name=call["name"],
+                           tool_call_id=call["id"])
+
+    def __call__(self, state):
+        calls = state["messages"][-1].tool_calls
+        # 提交全部后按原顺序收结果, 响应消息的顺序与调用顺序一致
+        futures = [self._executor.submit(self._run_call, call)
+                   for call in calls]
+        return {"messages": [future.result() for future in futures]}
+
+llm_tools = [create_test_plan, create_test_case,
+             validate_test_result, generate_test_report]
+knowledge_tools = [search_knowledge_base]
+session_tools = [get_test_progress, get_test_context,
+                 list_test_sessions, run_regression_test]
+device_tools = [connect_devices, swipe_screen, press_key,
+                click_element, input_text, get_device_info]
+performance_tools = [get_battery_status, get_logcat, get_memory_info,
+                     get_cpu_usage_by_package, get_fps_info,
+                     get_performance_snapshot]
+ALL_TOOLS = (llm_tools + knowledge_tools + session_tools
+             + device_tools + performance_tools)
+
+
+def build_agent():
+    """组装并编译 LangGraph 状态图"""
+    model_with_tools = primary_model.bind_tools(ALL_TOOLS)
+
+    def call_model(state):
+        response = _invoke_model(model_with_tools, state["messages"])
+        return {"messages": [response]}
+
+    def should_continue(state):
+        last = state["messages"][-1]
+        return "tools" if getattr(last, "tool_calls", None) else END
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", call_model)
+    graph.add_node("tools", ConcurrentToolNode(ALL_TOOLS))
+    graph.set_entry_point("agent")
+    graph.add_conditional_edges("agent", should_continue,
+                                {"tools": "tools", END: END})
+    graph.add_edge("tools", "agent")
+    return graph.compile()
+
+
+if __name__ == "__main__":
+    agent = build_agent()
+    result = agent.invoke({"messages": [
+        HumanMessage(content="对 com.example.app 做一轮启动性能巡检"),
+    ]})
+    print(result["messages"][-1].content)
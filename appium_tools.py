@@ -0,0 +1,81 @@
+"""Appium UI 操作封装
+
+adb_tools 覆盖不到的 UI 动作(WebView、系统按键序列等)
+走 Appium 会话执行。
+"""
+
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+
+_SERVER_URL = "http://127.0.0.1:4723"
+
+_KEYCODES = {
+    "back": 4,
+    "home": 3,
+    "menu": 82,
+    "enter": 66,
+    "volume_up": 24,
+    "volume_down": 25,
+}
+
+
+class AppiumUITools:
+    """Appium 会话与常用 UI 操作"""
+
+    def __init__(self, server_url=_SERVER_URL):
+        self.server_url = server_url
+        self.driver = None
+
+    def connect(self, device_id=None):
+        """建立 Appium 会话"""
+        options = UiAutomator2Options()
+        options.platform_name = "Android"
+        if device_id:
+            options.udid = device_id
+        self.driver = webdriver.Remote(self.server_url, options=options)
+        return f"已连接设备: {device_id or '默认设备'}"
+
+    def _ensure_driver(self, device_id=None):
+        if self.driver is None:
+            self.connect(device_id)
+        return self.driver
+
+    def swipe(self, direction="up", device_id=None):
+        """按方向滑动屏幕"""
+        driver = self._ensure_driver(device_id)
+        size = driver.get_window_size()
+        width, height = size["width"], size["height"]
+        cx, cy = width // 2, height // 2
+        moves = {
+            "up": (cx, int(height * 0.8), cx, int(height * 0.2)),
+            "down": (cx, int(height * 0.2), cx, int(height * 0.8)),
+            "left": (int(width * 0.8), cy, int(width * 0.2), cy),
+            "right": (int(width * 0.2), cy, int(width * 0.8), cy),
+        }
+        if direction not in moves:
+            return f"不支持的滑动方向: {direction}"
+        driver.swipe(*moves[direction], 300)
+        return f"已向{direction}滑动"
+
+    def press_key(self, key, device_id=None):
+        """按下系统按键"""
+        keycode = _KEYCODES.get(key)
+        if keycode is None:
+            return f"不支持的按键: {key}"
+        self._ensure_driver(device_id).press_keycode(keycode)
+        return f"已按下按键: {key}"
+
+    def tap_by_text(self, text, device_id=None):
+        """按文本定位并点击元素"""
+        driver = self._ensure_driver(device_id)
+        element = driver.find_element(
+            "xpath", f"//*[contains(@text, '{text}')]")
+        element.click()
+        return f"已点击元素: {text}"
+
+    def disconnect(self):
+        """关闭 Appium 会话"""
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+        return "会话已关闭"
@@ -0,0 +1,63 @@
+"""测试知识库的向量检索
+
+把测试经验/用例片段等文本条目嵌入成向量, 按余弦相似度检索,
+供 Agent 在规划用例时参考历史知识。
+"""
+
+import json
+import os
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+
+class VectorKnowledgeBase:
+    """基于句向量的轻量知识库"""
+
+    def __init__(self, index_path="knowledge_base.json",
+                 model_name="all-MiniLM-L6-v2"):
+        self.index_path = index_path
+        self.model = SentenceTransformer(model_name)
+        self.documents = []
+        self.embeddings = None
+        self._load()
+
+    def _load(self):
+        """从磁盘加载已有条目并重建嵌入矩阵"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.documents = data.get("documents", [])
+        if self.documents:
+            self.embeddings = self.model.encode(
+                self.documents, convert_to_numpy=True)
+
+    def save(self):
+        """落盘文档列表, 嵌入下次加载时重算"""
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f, ensure_ascii=False)
+
+    def embed(self, text):
+        """单条文本转 float32 向量"""
+        return self.model.encode([text], convert_to_numpy=True)[0]
+
+    def add_document(self, text):
+        """新增一条知识条目"""
+        vec = self.embed(text)
+        self.documents.append(text)
+        if self.embeddings is None:
+            self.embeddings = vec[np.newaxis, :]
+        else:
+            self.embeddings = np.vstack([self.embeddings, vec])
+
+    def search(self, query, top_k=5):
+        """按余弦相似度返回 top_k 条 (文本, 相似度)"""
+        if self.embeddings is None or not self.documents:
+            return []
+        q = self.embed(query)
+        norms = (np.linalg.norm(self.embeddings, axis=1)
+                 * np.linalg.norm(q)) + 1e-12
+        sims = self.embeddings @ q / norms
+        order = np.argsort(sims)[::-1][:top_k]
+        return [(self.documents[i], float(sims[i])) for i in order]
@@ -0,0 +1,533 @@
+"""基于深度学习的自适应测试用例生成器
+
+使用 CodeBERT 理解应用结构, 结合 LSTM 序列模型与测试模板
+自动生成 UI/接口/性能/安全 四类测试用例。
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+from collections import OrderedDict, deque
+from itertools import chain
+from typing import Optional
+
+import torch
+import torch.nn as nn
+from transformers import AutoModel, AutoTokenizer
+
+try:
+    import numpy as np
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+# 特征数低于该阈值时纯 Python 过滤更快(免去数组转换与 JIT 调度)
+_NUMBA_MIN_FEATURES = 128
+
+if _HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _filter_critical_mask(importances, threshold):
+        n = importances.shape[0]
+        mask = np.empty(n, np.bool_)
+        for i in prange(n):
+            mask[i] = importances[i] > threshold
+        return mask
+
+
+_EOS_ID = 0
+
+
+def _greedy_decode(decoder, out_proj, embedding, decoder_input, hidden, cell,
+                   max_length: int, eos_id: int = _EOS_ID):
+    """贪心解码循环: 预分配 logits 张量, 逐步写入, argmax 选取下一个 token
+
+    整个 batch 都产出 EOS 后提前结束, 解码耗时正比于实际输出长度;
+    未写入的尾部槽位保持为零。
+    """
+    batch_size = decoder_input.size(0)
+    logits = torch.zeros(batch_size, max_length, out_proj.out_features,
+                         dtype=hidden.dtype, device=decoder_input.device)
+    done = torch.zeros(batch_size, dtype=torch.bool, device=decoder_input.device)
+    for t in range(max_length):
+        output, (hidden, cell) = decoder(decoder_input, (hidden, cell))
+        output = out_proj(output.squeeze(1))
+        logits[:, t] = output
+        top_idx = output.argmax(dim=-1, keepdim=True)
+        done = done | (top_idx.squeeze(-1) == eos_id)
+        if bool(done.all()):
+            break
+        decoder_input = embedding(top_idx)
+    return logits
+
+
+try:
+    # 将整个解码循环编译为 TorchScript 图, 消除逐步的 Python 调度开销
+    _greedy_decode = torch.jit.script(_greedy_decode)
+except Exception:
+    # 脚本化失败时退回解释执行(仍然保留 argmax + 预分配的收益)
+    pass
+
+
+class _CudaGraphStep:
+    """把固定形状的单步解码捕获为 CUDA Graph, 回放免去逐步 kernel 启动"""
+
+    def __init__(self, decoder, out_proj, decoder_input, hidden, cell):
+        self.static_in = decoder_input.clone()
+        self.static_h = hidden.clone()
+        self.static_c = cell.clone()
+
+        # 在侧流上预热几轮, 让 cuDNN/分配器稳定后再捕获
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                out, _ = decoder(self.static_in, (self.static_h, self.static_c))
+                out_proj(out.squeeze(1))
+        torch.cuda.current_stream().wait_stream(stream)
+
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph):
+            out, (h, c) = decoder(self.static_in, (self.static_h, self.static_c))
+            self.static_logits = out_proj(out.squeeze(1))
+            self.static_h_out = h
+            self.static_c_out = c
+
+    def replay(self):
+        self.graph.replay()
+        # 输出状态回填为下一步输入状态
+        self.static_h.copy_(self.static_h_out)
+        self.static_c.copy_(self.static_c_out)
+        return self.static_logits
+
+
+_graph_step_cache = {}
+
+
+@torch.jit.ignore
+def _graphed_decode(decoder, out_proj, embedding, decoder_input, hidden, cell,
+                    max_length: int, eos_id: int) -> torch.Tensor:
+    """GPU 上用 CUDA Graph 回放解码; 捕获失败时回退普通解码"""
+    key = (decoder_input.size(0), decoder_input.dtype)
+    step = _graph_step_cache.get(key)
+    try:
+        if step is None:
+            step = _CudaGraphStep(decoder, out_proj, decoder_input, hidden, cell)
+            _graph_step_cache[key] = step
+        else:
+            step.static_h.copy_(hidden)
+            step.static_c.copy_(cell)
+        step.static_in.copy_(decoder_input)
+    except Exception:
+        return _greedy_decode(decoder, out_proj, embedding,
+                              decoder_input, hidden, cell, max_length, eos_id)
+
+    batch_size = decoder_input.size(0)
+    logits = torch.zeros(batch_size, max_length, out_proj.out_features,
+                         dtype=step.static_logits.dtype, device=decoder_input.device)
+    done = torch.zeros(batch_size, dtype=torch.bool, device=decoder_input.device)
+    for t in range(max_length):
+        output = step.replay()
+        logits[:, t] = output
+        top_idx = output.argmax(dim=-1, keepdim=True)
+        done |= top_idx.squeeze(-1) == eos_id
+        if bool(done.all()):
+            break
+        step.static_in.copy_(embedding(top_idx))
+    return logits
+
+
+class TestCaseGenerator(nn.Module):
+    """LSTM 编码-解码测试用例生成模型"""
+
+    def __init__(self, vocab_size=10000, embedding_dim=256, hidden_dim=512):
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.hidden_dim = hidden_dim
+        self.embedding = nn.Embedding(vocab_size, embedding_dim)
+        self.encoder = nn.LSTM(embedding_dim, hidden_dim,
+                               batch_first=True, bidirectional=True)
+        self.decoder = nn.LSTM(embedding_dim, hidden_dim * 2, batch_first=True)
+        self.test_case_output = nn.Linear(hidden_dim * 2, vocab_size)
+        self.test_data_generator = nn.Linear(hidden_dim * 2, 128)
+
+    def forward(self, input_ids, attention_mask: Optional[torch.Tensor] = None,
+                max_length: int = 200):
+        embedded = self.embedding(input_ids)
+        encoded, (hidden, cell) = self.encoder(embedded)
+
+        # 测试数据向量取有效 token 的掩码均值, padding 不参与
+        if attention_mask is None:
+            attention_mask = (input_ids != 0).to(encoded.dtype)
+        mask = attention_mask.unsqueeze(-1).to(encoded.dtype)
+        pooled = (encoded * mask).sum(1) / mask.sum(1).clamp_min(1.0)
+        test_data = self.test_data_generator(pooled)
+
+        # 双向编码器的末状态拼接为解码器初始状态
+        hidden = torch.cat([hidden[0], hidden[1]], dim=-1).unsqueeze(0)
+        cell = torch.cat([cell[0], cell[1]], dim=-1).unsqueeze(0)
+
+        batch_size = input_ids.size(0)
+        decoder_input = self.embedding(
+            torch.zeros(batch_size, 1, dtype=torch.long, device=input_ids.device))
+
+        if not torch.jit.is_scripting() and decoder_input.is_cuda:
+            logits = _graphed_decode(self.decoder, self.test_case_output,
+                                     self.embedding, decoder_input, hidden, cell,
+                                     max_length, _EOS_ID)
+        else:
+            logits = _greedy_decode(self.decoder, self.test_case_output,
+                                    self.embedding, decoder_input, hidden, cell,
+                                    max_length)
+        return logits, test_data
+
+
+class AdaptiveTestGenerator:
+    """自适应测试用例生成器, 结合模板库与神经网络生成"""
+
+    _ENC_CACHE_MAX = 32
+
+    def __init__(self):
+        # use_fast 保证拿到 Rust 实现的 tokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            "microsoft/codebert-base", use_fast=True)
+        self._tok_cache = {}
+        # 两个模型同居一个设备; tokenizer 产出的是 CPU 张量,
+        # 前向之前统一搬到这里 (freeze 后模型没有 parameters 可查)
+        self._device = (torch.device("cuda") if torch.cuda.is_available()
+                        else torch.device("cpu"))
+        if torch.cuda.is_available():
+            # GPU 上用 FP16; low_cpu_mem_usage 跳过随机初始化再覆盖的浪费
+            self.language_model = AutoModel.from_pretrained(
+                "microsoft/codebert-base",
+                torch_dtype=torch.float16,
+                low_cpu_mem_usage=True,
+            ).eval().cuda()
+        else:
+            # CPU 推理对 Linear 层做 int8 动态量化: 带宽减 4 倍, 吞吐约 2-4 倍
+            self.language_model = AutoModel.from_pretrained(
+                "microsoft/codebert-base",
+                low_cpu_mem_usage=True,
+            ).eval()
+            self.language_model = torch.quantization.quantize_dynamic(
+                self.language_model, {nn.Linear}, dtype=torch.qint8)
+        self.language_model.requires_grad_(False)
+        try:
+            # trace + freeze 做算子融合与常量折叠, 并预热触发按形状特化
+            dummy = self.tokenizer("x", return_tensors="pt")
+            example = (dummy["input_ids"], dummy["attention_mask"])
+            if torch.cuda.is_available():
+                example = tuple(t.cuda() for t in example)
+            traced = torch.jit.trace(self.language_model, example, strict=False)
+            traced = torch.jit.freeze(traced)
+            with torch.inference_mode(), torch.jit.optimized_execution(True):
+                traced(*example)
+            self.language_model = traced
+        except Exception:
+            # 导出失败时继续用 eager 模型
+            pass
+        self.model = TestCaseGenerator()
+        self.model.eval()
+        self.model.requires_grad_(False)
+        if torch.cuda.is_available():
+            self.model = self.model.half().cuda()
+        try:
+            scripted = torch.jit.script(self.model)
+            # 用哑输入预热一次, 触发按形状特化编译, 避免首次真实调用的编译税
+            device = next(scripted.parameters()).device
+            dummy = torch.zeros(1, 8, dtype=torch.long, device=device)
+            with torch.inference_mode(), torch.jit.optimized_execution(True):
+                scripted(dummy, max_length=4)
+            self.model = scripted
+        except Exception:
+            # 脚本化失败时保留 eager 模型, eval/no-grad 的收益仍然生效
+            pass
+        # 历史记录固定容量 + 内容哈希去重, 避免长会话下无界增长;
+        # 去重键按入史顺序另存一份, 随 deque 淘汰同步出集
+        self.test_case_history = deque(maxlen=10_000)
+        self._history_keys = set()
+        self._history_key_order = deque()
+        # 编码结果与结构分析均按 app_info 指纹缓存, 同一应用多次调用免重算
+        self._enc_cache = OrderedDict()
+        self._analysis_cache = {}
+        self.test_templates = {
+            "ui_test": [
+                "验证{元素}点击后跳转正确",
+                "检查{元素}在不同分辨率下的显示",
+                "测试{元素}的{操作}响应时间",
+                "验证{功能}的界面布局符合设计稿",
+            ],
+            "api_test": [
+                "测试{接口}的正常返回",
+                "验证{接口}的参数校验",
+                "检查{接口}的异常处理",
+                "测试{接口}的并发访问",
+            ],
+            "performance_test": [
+                "测试{功能}的加载耗时",
+                "验证{功能}在低内存下的表现",
+                "检查{功能}的内存占用",
+            ],
+            "security_test": [
+                "验证{接口}的权限控制",
+                "检查{元素}的输入注入防护",
+                "测试{功能}的敏感数据加密",
+            ],
+        }
+        # 静态模板在初始化时一次性预分词
+        self._tpl_ids = {
+            tpl: self.tokenizer(tpl, return_tensors="pt")["input_ids"]
+            for templates in self.test_templates.values()
+            for tpl in templates
+        }
+
+    @staticmethod
+    def _fingerprint(app_info):
+        """app_info 的内容指纹, 作为各级缓存的键"""
+        payload = json.dumps(app_info, sort_keys=True, ensure_ascii=False).encode()
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def _encode_app_info(self, app_info):
+        """运行编码器并缓存 (encoded, hidden, cell), 带 LRU 上限"""
+        key = self._fingerprint(app_info)
+        cached = self._enc_cache.get(key)
+        if cached is not None:
+            self._enc_cache.move_to_end(key)
+            return cached
+
+        text = json.dumps(app_info, sort_keys=True, ensure_ascii=False)
+        inputs = self._tokenize_cached(text)
+        input_ids = inputs["input_ids"].to(self._device)
+        with torch.inference_mode():
+            embedded = self.model.embedding(input_ids)
+            encoded, (hidden, cell) = self.model.encoder(embedded)
+
+        self._enc_cache[key] = (encoded, hidden, cell)
+        if len(self._enc_cache) > self._ENC_CACHE_MAX:
+            self._enc_cache.popitem(last=False)
+        return encoded, hidden, cell
+
+    def _tokenize_cached(self, text):
+        """按内容哈希缓存分词结果, 重复文本零开销"""
+        key = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+        cached = self._tok_cache.get(key)
+        if cached is None:
+            cached = self.tokenizer(text, return_tensors="pt",
+                                    truncation=True, max_length=512)
+            self._tok_cache[key] = cached
+        return cached
+
+    def encode_prompts(self, texts):
+        """批量编码提示文本: 一次 padded 前向代替逐条前向
+
+        所有 (test_type, i) 的提示应收集后整批传入,
+        而不是在 count×types 循环里逐条调用编码器。
+        """
+        batch = self.tokenizer(list(texts), padding=True, truncation=True,
+                               max_length=128, return_tensors="pt")
+        with torch.inference_mode():
+            outputs = self.language_model(batch["input_ids"].to(self._device),
+                                          batch["attention_mask"].to(self._device))
+        # traced/frozen 模型返回 tuple/dict, eager 模型返回 ModelOutput
+        if isinstance(outputs, dict):
+            hidden_state = outputs["last_hidden_state"]
+        elif isinstance(outputs, tuple):
+            hidden_state = outputs[0]
+        else:
+            hidden_state = outputs.last_hidden_state
+        return hidden_state.mean(dim=1)
+
+    def analyze_app_structure(self, app_info):
+        """分析应用结构, 提取 UI 元素/接口/核心功能"""
+        key = self._fingerprint(app_info)
+        if key in self._analysis_cache:
+            return self._analysis_cache[key]
+
+        features = app_info.get("features", ())
+        if _HAS_NUMBA and len(features) >= _NUMBA_MIN_FEATURES:
+            importances = np.fromiter(
+                (f.get("importance", 0) for f in features),
+                dtype=np.float64, count=len(features))
+            mask = _filter_critical_mask(importances, 0.7)
+            critical = [f for f, keep in zip(features, mask) if keep]
+        else:
+            critical = [f for f in features if f.get("importance", 0) > 0.7]
+
+        analysis = {
+            "ui_elements": list(chain.from_iterable(
+                screen.get("elements", ()) for screen in app_info.get("screens", ()))),
+            "api_endpoints": app_info.get("apis", []),
+            "critical_features": critical,
+            "performance_bottlenecks": [],
+            "security_concerns": [],
+        }
+
+        self._analysis_cache[key] = analysis
+        return analysis
+
+    def generate_test_cases(self, app_info, test_type="ui_test", count=5,
+                            analysis=None):
+        """按测试类型生成 count 条测试用例(物化列表的便捷入口)"""
+        return list(self.iter_test_cases(app_info, test_type, count, analysis))
+
+    def iter_test_cases(self, app_info, test_type="ui_test", count=5,
+                        analysis=None):
+        """逐条产出测试用例, 供调用方流式消费
+
+        调用方可传入已算好的 analysis, 避免在多类型循环里重复分析。
+        """
+        if analysis is None:
+            analysis = self.analyze_app_structure(app_info)
+        templates = self.test_templates.get(test_type, [])
+
+        # 采样全部提到循环外: 每个占位符一次 random.choices(k=count)
+        if templates:
+            tpl_picks = random.choices(templates, k=count)
+            ui = analysis["ui_elements"]
+            apis = analysis["api_endpoints"]
+            feats = analysis["critical_features"]
+            ui_picks = random.choices(ui, k=count) if ui else ["元素"] * count
+            api_picks = random.choices(apis, k=count) if apis else ["接口"] * count
+            feat_picks = ([f.get("name", "功能") for f in random.choices(feats, k=count)]
+                          if feats else ["功能"] * count)
+            op_picks = random.choices(self._OPERATIONS, k=count)
+
+        for i in range(count):
+            if templates:
+                picks = {"元素": ui_picks[i], "接口": api_picks[i],
+                         "功能": feat_picks[i], "操作": op_picks[i]}
+                test_case = self._fill_template(tpl_picks[i], analysis, picks)
+            else:
+                test_case = self._intelligent_generation(app_info, test_type)
+
+            case = {
+                "id": f"{test_type}_{i + 1}",
+                "type": test_type,
+                "title": test_case,
+                "steps": self._generate_test_steps(test_case),
+                "expected_result": self._generate_expected_result(test_case),
+                "priority": self._calculate_priority(test_case),
+                "tags": self._extract_tags(test_case),
+            }
+            self._record_history(case)
+            yield case
+
+    def _record_history(self, case):
+        """按 (type, title) 内容哈希去重后写入历史"""
+        key = hashlib.blake2b(
+            f"{case['type']}|{case['title']}".encode(), digest_size=8).digest()
+        if key in self._history_keys:
+            return
+        history = self.test_case_history
+        if len(history) == history.maxlen:
+            # 满员时 deque 会挤掉最老一条, 它的键同步出集,
+            # 与被淘汰用例同内容的新用例才能重新入史
+            self._history_keys.discard(self._history_key_order.popleft())
+        self._history_keys.add(key)
+        self._history_key_order.append(key)
+        history.append(case)
+
+    _PLACEHOLDER_RE = re.compile(r"\{([^}]+)\}")
+    _OPERATIONS = ["点击", "滑动", "长按", "输入"]
+
+    def _fill_template(self, template, analysis, picks=None):
+        """单次正则扫描填充模板占位符
+
+        picks 为调用方预采样的占位符取值; 缺省时按需单独采样。
+        """
+        if picks is None:
+            picks = {
+                "元素": (random.choice(analysis["ui_elements"])
+                       if analysis["ui_elements"] else "元素"),
+                "接口": (random.choice(analysis["api_endpoints"])
+                       if analysis["api_endpoints"] else "接口"),
+                "功能": (random.choice(analysis["critical_features"]).get("name", "功能")
+                       if analysis["critical_features"] else "功能"),
+                "操作": random.choice(self._OPERATIONS),
+            }
+        return self._PLACEHOLDER_RE.sub(
+            lambda m: picks.get(m.group(1), m.group(0)), template)
+
+    def _intelligent_generation(self, app_info, test_type):
+        """无模板时基于应用名称兜底生成"""
+        app_name = app_info.get("name", "应用")
+        return f"测试{app_name}的{test_type}场景"
+
+    _VERB_RE = re.compile(r"验证|检查|测试")
+    _STEPS = {
+        "验证": ["1. 启动应用", "2. 进入目标页面", "3. 执行验证操作", "4. 记录验证结果"],
+        "检查": ["1. 启动应用", "2. 定位检查目标", "3. 逐项检查", "4. 记录检查结果"],
+        "测试": ["1. 准备测试环境", "2. 执行测试操作", "3. 观察响应", "4. 记录测试数据"],
+    }
+    _RESULTS = {
+        "验证": "功能正常，符合预期",
+        "检查": "检查通过，无异常",
+        "测试": "操作成功，响应正确",
+    }
+
+    def _generate_test_steps(self, test_case):
+        """根据用例标题推断测试步骤"""
+        match = self._VERB_RE.search(test_case)
+        return self._STEPS.get(match.group(0) if match else "", [])
+
+    def _generate_expected_result(self, test_case):
+        """根据用例标题推断预期结果"""
+        match = self._VERB_RE.search(test_case)
+        return self._RESULTS.get(match.group(0) if match else "", "执行完成")
+
+    _PRIORITY_RE = re.compile("|".join(re.escape(k) for k in ["登录", "支付", "核心", "重要"]))
+    _TAG_RE = re.compile(r"UI|界面|API|接口|性能|安全")
+    _TAG_MAP = {"UI": "UI", "界面": "UI", "API": "API", "接口": "API",
+                "性能": "性能", "安全": "安全"}
+
+    def _calculate_priority(self, test_case):
+        """根据关键词判断用例优先级"""
+        return "高" if self._PRIORITY_RE.search(test_case) else "中"
+
+    def _extract_tags(self, test_case):
+        """从用例标题提取标签"""
+        tags = []
+        for match in self._TAG_RE.findall(test_case):
+            tag = self._TAG_MAP[match]
+            if tag not in tags:
+                tags.append(tag)
+        return tags
+
+
+_GENERATOR_SINGLETON: Optional[AdaptiveTestGenerator] = None
+_generator_lock = threading.Lock()
+
+
+def _get_generator():
+    """惰性初始化的进程级生成器单例, 避免每次调用重新加载模型"""
+    global _GENERATOR_SINGLETON
+    if _GENERATOR_SINGLETON is None:
+        with _generator_lock:
+            if _GENERATOR_SINGLETON is None:
+                _GENERATOR_SINGLETON = AdaptiveTestGenerator()
+    return _GENERATOR_SINGLETON
+
+
+def generate_adaptive_tests(app_info, test_types=None):
+    """为应用生成全套自适应测试用例"""
+    generator = _get_generator()
+    if test_types is None:
+        test_types = ["ui_test", "api_test", "performance_test", "security_test"]
+
+    analysis = generator.analyze_app_structure(app_info)
+
+    all_test_cases = {}
+    total_count = 0
+    for test_type in test_types:
+        cases = list(generator.iter_test_cases(app_info, test_type, count=5,
+                                               analysis=analysis))
+        all_test_cases[test_type] = cases
+        total_count += len(cases)
+
+    return {
+        "test_cases": all_test_cases,
+        "total_count": total_count,
+        "analysis_summary": analysis,
+    }